@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+#
+# This file is part of wajig.  The copyright file is at debian/copyright.
+
+"""Benchmark wajig against synthetic dpkg and APT state.
+
+A fake root is generated for each scale (number of available packages)
+with a dpkg status file and info lists, APT Packages, Sources, and
+Contents lists, and a download cache of (sparse) package files. APT
+(through APT_CONFIG), dpkg (through DPKG_ADMINDIR), and wajig (through
+HOME) are pointed at the fake root, so the live system is neither read
+nor changed, and the wajig functions behind a number of commands are
+timed there. The data is generated from a fixed seed so that runs of
+different wajig releases can be compared.
+
+Each scale runs in a separate process since APT's configuration and
+wajig's directories are fixed when they are first imported. The
+results are written as JSON:
+
+  python3 benchmarks/run.py --scale 1000 --scale 10000 --output bench.json
+
+Each result records the time of the first (cold) run, when wajig's own
+caches are empty, and the minimum, median, and mean of the later
+(warm) runs, together with the time taken by the commands wajig ran."""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+import contextlib
+
+SCALES = (1000, 10000, 100000)
+RUNS = 5
+SEED = 20241206
+
+# The share of the available packages that are installed.
+
+INSTALLED = 0.25
+
+SECTIONS = ("admin", "devel", "doc", "editors", "libs", "net", "python",
+            "utils", "x11", "oldlibs", "science", "text")
+
+ARCH = "amd64"
+
+ORIGIN = "bench.invalid_debian_dists_bench"
+
+MAINTAINER = "Bench Maintainers <bench@bench.invalid>"
+
+APT_CONF = """\
+Dir "{root}/";
+Dir::State::status "{root}/var/lib/dpkg/status";
+Dir::Etc::SourceList "{root}/etc/apt/sources.list";
+Dir::Etc::SourceParts "{root}/etc/apt/sources.list.d";
+APT::Architecture "{arch}";
+APT::Architectures {{ "{arch}"; }};
+Debug::NoLocking "true";
+Acquire::IndexTargets::deb::Contents-deb {{
+  MetaKey "$(COMPONENT)/Contents-$(ARCHITECTURE)";
+  ShortDescription "Contents-$(ARCHITECTURE)";
+  Description "$(RELEASE)/$(COMPONENT) $(ARCHITECTURE) Contents";
+}};
+"""
+
+
+# ------------------------------------------------------------------------
+# SYNTHETIC STATE
+
+
+def name(i):
+    return "lib{:06d}".format(i) if i % 5 == 0 else "pkg{:06d}".format(i)
+
+
+def version(rng, i, bump=0):
+    epoch = "1:" if i % 17 == 0 else ""
+    # A negative bump stops at zero so the version stays valid.
+    return "{}{}.{}.{}-{}".format(epoch, i % 7, rng.randrange(20),
+                                  max(rng.randrange(10) + bump, 0),
+                                  1 + i % 3)
+
+
+def packages(scale, rng):
+    """Return the synthetic packages as a list of dicts."""
+    result = list()
+    for i in range(scale):
+        depends = list()
+        for _ in range(rng.randrange(6) if i else 0):
+            target = name(rng.randrange(i))
+            if rng.random() < 0.2:
+                depends.append("{} (>= 0.1)".format(target))
+            elif rng.random() < 0.1:
+                depends.append("{} | {}".format(target,
+                                                name(rng.randrange(i))))
+            else:
+                depends.append(target)
+        result.append(dict(
+            name=name(i),
+            version=version(rng, i),
+            section="libs" if name(i).startswith("lib")
+            else rng.choice(SECTIONS),
+            priority="important" if i < 20 else "optional",
+            size=rng.randrange(1, 50000),
+            depends=sorted(set(depends)),
+            recommends=[name(rng.randrange(i))] if i and i % 4 == 0 else [],
+            provides=["virtual{}".format(i % 50)] if i % 50 == 1 else [],
+            source="src{:06d}".format(i // 2),
+            files=["usr/share/doc/{}/copyright".format(name(i)),
+                   "usr/share/doc/{}/changelog.Debian.gz".format(name(i))] +
+            ["usr/{}/{}/file{}".format("lib" if i % 5 == 0 else "bin",
+                                       name(i), n)
+             for n in range(rng.randrange(1, 15))],
+        ))
+    return result
+
+
+def stanza(fields):
+    return "".join("{}: {}\n".format(key, value)
+                   for key, value in fields if value) + "\n"
+
+
+def package_stanza(p, version, extra=()):
+    return stanza([
+        ("Package", p["name"]),
+        ("Architecture", ARCH),
+        ("Version", version),
+        ("Priority", p["priority"]),
+        ("Section", p["section"]),
+        ("Maintainer", MAINTAINER),
+        ("Source", p["source"]),
+        ("Installed-Size", p["size"]),
+        ("Provides", ", ".join(p["provides"])),
+        ("Depends", ", ".join(p["depends"])),
+        ("Recommends", ", ".join(p["recommends"])),
+    ] + list(extra) + [
+        ("Description", "synthetic package {}\n benchmark data".format(
+            p["name"])),
+    ])
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def generate(root, scale):
+    """Write the synthetic dpkg and APT state for SCALE packages to ROOT."""
+    rng = random.Random(SEED + scale)
+    available = packages(scale, rng)
+    lists = os.path.join(root, "var/lib/apt/lists")
+    admin = os.path.join(root, "var/lib/dpkg")
+    archives = os.path.join(root, "var/cache/apt/archives")
+    for directory in (lists, os.path.join(admin, "info"), archives,
+                      os.path.join(archives, "partial"),
+                      os.path.join(root, "etc/apt/apt.conf.d"),
+                      os.path.join(root, "etc/apt/sources.list.d"),
+                      os.path.join(root, "etc/apt/preferences.d"),
+                      os.path.join(root, "var/cache/apt"),
+                      os.path.join(root, "var/log/apt"),
+                      os.path.join(root, "home")):
+        os.makedirs(directory, exist_ok=True)
+
+    write(os.path.join(root, "apt.conf"),
+          APT_CONF.format(root=root, arch=ARCH))
+    write(os.path.join(root, "etc/apt/sources.list"),
+          "deb [trusted=yes] http://bench.invalid/debian bench main security\n"
+          "deb-src [trusted=yes] http://bench.invalid/debian bench main\n")
+    write(os.path.join(lists, ORIGIN + "_Release"), stanza([
+        ("Origin", "Bench"), ("Label", "Bench"), ("Suite", "bench"),
+        ("Codename", "bench"), ("Architectures", ARCH),
+        ("Components", "main security"),
+    ]))
+
+    # Most packages are in main. A small security component gets the
+    # newer versions of a few, as an hourly update typically would.
+
+    main, security = list(), list()
+    for p in available:
+        main.append(package_stanza(p, p["version"], [
+            ("Filename", "pool/main/{0}_{1}_{2}.deb".format(
+                p["name"], p["version"].split(":")[-1], ARCH)),
+            ("Size", p["size"] * 300)]))
+    for p in available[::max(1, scale // 50)]:
+        newer = p["version"] + "+deb1"
+        security.append(package_stanza(p, newer, [
+            ("Filename", "pool/security/{}.deb".format(p["name"])),
+            ("Size", p["size"] * 300)]))
+    write(os.path.join(lists, ORIGIN + "_main_binary-amd64_Packages"),
+          "".join(main))
+    write(os.path.join(lists, ORIGIN + "_security_binary-amd64_Packages"),
+          "".join(security))
+
+    sources = dict()
+    for p in available:
+        sources.setdefault(p["source"], list()).append(p)
+    write(os.path.join(lists, ORIGIN + "_main_source_Sources"), "".join(
+        stanza([
+            ("Package", source),
+            ("Binary", ", ".join(b["name"] for b in binaries)),
+            ("Version", binaries[0]["version"]),
+            ("Build-Depends", ", ".join(
+                ["debhelper-compat (= 13)"] +
+                [name(rng.randrange(scale)) for _ in range(rng.randrange(4))])),
+        ]) for source, binaries in sorted(sources.items())))
+
+    write(os.path.join(lists, ORIGIN + "_main_Contents-amd64"), "".join(
+        "{}\t{}/{}\n".format(path, p["section"], p["name"])
+        for p in available for path in p["files"]))
+
+    # The installed packages, some at older versions (upgradable), a
+    # few on hold, and a few removed with their configuration left.
+
+    installed = available[:int(scale * INSTALLED)]
+    status, auto = list(), list()
+    for i, p in enumerate(installed):
+        state = "install ok installed"
+        if i % 97 == 0:
+            state = "hold ok installed"
+        elif i % 89 == 0:
+            state = "deinstall ok config-files"
+        current = p["version"] if i % 11 else version(rng, i, bump=-1)
+        status.append(package_stanza(p, current, [("Status", state)]))
+        if state.endswith("installed"):
+            write(os.path.join(admin, "info", p["name"] + ".list"),
+                  "".join("/" + path + "\n" for path in p["files"]))
+        if i % 3:
+            auto.append(stanza([("Package", p["name"]),
+                                ("Architecture", ARCH),
+                                ("Auto-Installed", "1")]))
+    write(os.path.join(admin, "status"), "".join(status))
+    write(os.path.join(root, "var/lib/apt/extended_states"), "".join(auto))
+
+    for p in available[::20]:
+        filename = "{}_{}_{}.deb".format(
+            p["name"], p["version"].replace(":", "%3a"), ARCH)
+        with open(os.path.join(archives, filename), "wb") as f:
+            f.truncate(p["size"] * 300)
+
+    return dict(available=len(available), installed=len(installed),
+                sources=len(sources), archives=len(available[::20]))
+
+
+def environment(root):
+    """The environment variables pointing APT, dpkg and wajig at ROOT."""
+    return dict(APT_CONFIG=os.path.join(root, "apt.conf"),
+                DPKG_ADMINDIR=os.path.join(root, "var/lib/dpkg"),
+                HOME=os.path.join(root, "home"))
+
+
+# ------------------------------------------------------------------------
+# TIMING
+
+
+@contextlib.contextmanager
+def quiet():
+    """Send standard output, including that of subprocesses, to /dev/null."""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(devnull)
+
+
+def measure(function, runs, setup=None):
+    """Time FUNCTION: a cold first run then RUNS - 1 warm ones."""
+    import wajig.perform as perform
+
+    times, commands = list(), list()
+    for _ in range(runs):
+        if setup:
+            setup()
+        done = len(perform.timings)
+        start = time.perf_counter()
+        with quiet():
+            function()
+        times.append(time.perf_counter() - start)
+        commands.append(sum(t["wall"] for t in perform.timings[done:]))
+    warm = times[1:] or times
+    return dict(cold=times[0], min=min(warm), median=statistics.median(warm),
+                mean=statistics.mean(warm), runs=runs,
+                commands=statistics.median(commands))
+
+
+def benchmarks(root, scale):
+    """Return the benchmarks as a list of names, functions and setups."""
+    from argparse import Namespace
+
+    import wajig.util as util
+    import wajig.status as status
+    import wajig.depgraph as depgraph
+    import wajig.sources as sources
+    import wajig.archives as archives
+    import wajig.versions as versions
+    import wajig.commands as commands
+
+    lists = os.path.join(root, "var/lib/apt/lists")
+    security = os.path.join(lists, ORIGIN + "_security_binary-amd64_Packages")
+    target = name(scale // 2 - scale // 2 % 5)  # A library.
+    options = dict(teach=False, noop=False)
+    counter = [0]
+
+    def touch_security():
+        # A new version in the security list, as after an update.
+        counter[0] += 1
+        p = dict(name="bench-security", priority="optional",
+                 section="admin", source="bench-security", size=1,
+                 provides=[], depends=[], recommends=[])
+        with open(security, "a") as f:
+            f.write(package_stanza(p, "1.{}".format(counter[0]), [
+                ("Filename", "pool/security/bench-security.deb"),
+                ("Size", 300)]))
+
+    def forget_status():
+        # Have the dpkg status file parsed again.
+        status._loaded.clear()
+
+    return [
+        ("update_available", lambda: util.update_available(noreport=True),
+         None),
+        ("update_available (security list changed)",
+         lambda: util.update_available(noreport=True), touch_security),
+        ("count_upgrades", util.count_upgrades, None),
+        ("status parse", status.load, forget_status),
+        ("do_status", lambda: util.do_status([]), None),
+        ("sizes", util.sizes, None),
+        ("dependents", lambda: commands.dependents(
+            Namespace(package=target, **options)), None),
+        ("listsections", lambda: commands.listsections(
+            Namespace(**options)), None),
+        ("orphans", depgraph.compute_orphans, forget_status),
+        ("rbuilddeps", lambda: sources.rbuilddeps(target, recursive=True),
+         None),
+        ("listcache", archives.load, None),
+        ("versions", lambda: versions.report(), None),
+        ("search", lambda: commands.search(
+            Namespace(patterns=[target], verbose=0, **options)), None),
+        ("whichpackage", lambda: commands.whichpackage(
+            Namespace(pattern=target, **options)), None),
+    ]
+
+
+def run_scale(root, scale, runs, only):
+    """Generate the state for SCALE in ROOT and time the benchmarks.
+
+    This runs in a process whose environment already points at ROOT."""
+
+    start = time.perf_counter()
+    counts = generate(root, scale)
+    generated = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with quiet():
+        import wajig.commands  # noqa: F401 (imports and initialises)
+    imported = time.perf_counter() - start
+
+    # Importing wajig also initialises its files (a first update_available).
+    results = [dict(name="import", cold=imported, runs=1)]
+    for title, function, setup in benchmarks(root, scale):
+        if only and not any(word in title for word in only):
+            continue
+        try:
+            result = measure(function, runs, setup)
+        except Exception as error:  # Report, and go on to the next.
+            result = dict(error="{}: {}".format(type(error).__name__, error))
+        results.append(dict(name=title, **result))
+    return dict(scale=scale, generated=generated, counts=counts,
+                results=results)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        epilog="The JSON results are written to standard output by default.")
+    parser.add_argument("--scale", type=int, action="append",
+                        help="number of available packages (repeatable; "
+                        "default {})".format(", ".join(map(str, SCALES))))
+    parser.add_argument("--runs", type=int, default=RUNS,
+                        help="runs of each benchmark (default %(default)s)")
+    parser.add_argument("--only", action="append",
+                        help="only benchmarks whose name contains this")
+    parser.add_argument("--output", help="write the JSON results here")
+    parser.add_argument("--keep", action="store_true",
+                        help="keep the generated roots")
+    parser.add_argument("--root", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.root:
+        # A child process for one scale.
+        result = run_scale(args.root, args.scale[0], args.runs, args.only)
+        print(json.dumps(result))
+        return
+
+    import shutil
+    import tempfile
+
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    report = dict(python=platform.python_version(),
+                  machine=platform.machine(), cpus=os.cpu_count(),
+                  date=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                  revision=None, scales=list())
+    try:
+        report["revision"] = subprocess.check_output(
+            ["git", "-C", here, "describe", "--always", "--dirty"],
+            text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+
+    for scale in args.scale or SCALES:
+        root = tempfile.mkdtemp(prefix="wajig-bench-{}-".format(scale))
+        env = dict(os.environ, **environment(root))
+        env["PYTHONPATH"] = os.pathsep.join(
+            filter(None, [here, env.get("PYTHONPATH")]))
+        command = [sys.executable, os.path.abspath(__file__),
+                   "--root", root, "--scale", str(scale),
+                   "--runs", str(args.runs)]
+        for word in args.only or ():
+            command += ["--only", word]
+        print("Benchmarking {} packages in {}".format(scale, root),
+              file=sys.stderr)
+        try:
+            output = subprocess.check_output(command, env=env, text=True)
+            report["scales"].append(json.loads(output.splitlines()[-1]))
+        except (subprocess.CalledProcessError, ValueError, IndexError) as e:
+            report["scales"].append(dict(scale=scale, error=str(e)))
+        finally:
+            if not args.keep:
+                shutil.rmtree(root, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
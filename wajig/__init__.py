@@ -22,12 +22,18 @@
 
 import argparse
 import sys
+import time
 
-import wajig.util as util
-import wajig.commands as commands
+import wajig.trace as trace
 
-from wajig.constants import APP, VERSION
-from wajig.shell import main as wajigshell
+with trace.span("import"):
+    import wajig.util as util
+    import wajig.perform as perform
+    import wajig.commands as commands
+    import wajig.services as services
+
+    from wajig.constants import APP, VERSION
+    from wajig.shell import main as wajigshell
 
 
 def main():
@@ -39,7 +45,7 @@ def main():
 
     parser = argparse.ArgumentParser(
         prog=APP,
-        usage="wajig [-h] [-V] [<command> [--help] [--teach] [--noop] [<options>]]",
+        usage="wajig [-h] [-V] [--profile] [--trace] [<command> [--help] [--teach] [--noop] [<options>]]",
         description="Unified package management front-end for Debian/Ubuntu.",
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog=(
@@ -68,6 +74,13 @@ def main():
         help="display commands to be executed, before actual execution"
     )
 
+    parser_daemons = argparse.ArgumentParser(add_help=False)
+    parser_daemons.add_argument("daemon", nargs="+")
+    parser_daemons.add_argument(
+        "--timeout", type=int, default=services.TIMEOUT,
+        help="seconds to allow each daemon (default %(default)s)",
+    )
+
     parser_verbose = argparse.ArgumentParser(add_help=False)
     message = "turn on verbose output"
     parser_verbose.add_argument(
@@ -119,6 +132,16 @@ def main():
         help="use packages from local cache; don't download anything",
     )
 
+    parser_sections = argparse.ArgumentParser(add_help=False)
+    group = parser_sections.add_mutually_exclusive_group()
+    group.add_argument(
+        "-a", "--all", action="store_const", dest="sections", const=[],
+        help="consider packages of all sections, not only libraries",
+    )
+    group.add_argument(
+        "--section", action="append", dest="sections",
+        help="consider packages of this section (may be repeated)",
+    )
     parser_grep = argparse.ArgumentParser(add_help=False)
     parser_grep.add_argument(
         "pattern", nargs="?",
@@ -131,6 +154,19 @@ def main():
         version="%(prog)s " + VERSION
     )
 
+    message = "time the commands run and print a breakdown at the end"
+    parser.add_argument(
+        "--profile", action="store_true", help=message,
+    )
+    message = "time the phases of the command and print a summary at the end"
+    parser.add_argument(
+        "--trace", action="store_true", help=message,
+    )
+    message = "write the phase timings to FILE as Chrome trace events"
+    parser.add_argument(
+        "--trace-file", metavar="FILE", help=message,
+    )
+
     subparsers = parser.add_subparsers(
         title='subcommands', help=argparse.SUPPRESS
     )
@@ -202,6 +238,10 @@ def main():
     parser_adduser.add_argument("number", nargs="?")
     parser_adduser.add_argument("username", nargs="*")
     parser_adduser.add_argument("--file")
+    parser_adduser.add_argument(
+        "--json", action="store_true",
+        help="output the result for each user as JSON",
+    )
     parser_adduser.set_defaults(func=function)
 
     function = commands.autoalts
@@ -211,7 +251,11 @@ def main():
         aliases="autoalternatives auto-alternatives auto-alts".split(),
         description=function.__doc__,
     )
-    parser_autoalts.add_argument("alternative")
+    parser_autoalts.add_argument("alternative", nargs="*")
+    parser_autoalts.add_argument(
+        "-a", "--all", action="store_true",
+        help="reset all alternatives to auto",
+    )
     parser_autoalts.set_defaults(func=function)
 
     function = commands.autoclean
@@ -269,6 +313,14 @@ def main():
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
     parser_changelog.add_argument("package")
+    parser_changelog.add_argument(
+        "--offline", action="store_true",
+        help="only display a changelog already in the cache",
+    )
+    parser_changelog.add_argument(
+        "--uri",
+        help="changelog URI template, as for python-apt get_changelog",
+    )
     parser_changelog.set_defaults(func=function)
 
     function = commands.clean
@@ -530,7 +582,7 @@ def main():
     function = commands.listalternatives
     parser_listalternatives = subparsers.add_parser(
         "listalternatives",
-        parents=[parser_teach],
+        parents=[parser_verbose, parser_teach],
         aliases="listalts list-alternatives".split(),
         description=function.__doc__,
     )
@@ -656,6 +708,15 @@ def main():
     )
     parser_liststatus.set_defaults(func=function)
 
+    function = commands.localupgrade
+    parser_localupgrade = subparsers.add_parser(
+        "localupgrade",
+        aliases=["local-upgrade"],
+        parents=[parser_teach],
+        description=function.__doc__,
+    )
+    parser_localupgrade.set_defaults(func=function)
+
     function = commands.madison
     parser_madison = subparsers.add_parser(
         "madison",
@@ -663,6 +724,10 @@ def main():
         description=function.__doc__,
     )
     parser_madison.add_argument("packages", nargs="+")
+    parser_madison.add_argument(
+        "--json", action="store_true",
+        help="output the versions of each package as JSON",
+    )
     parser_madison.set_defaults(func=function)
 
     function = commands.move
@@ -679,6 +744,10 @@ def main():
         parents=[parser_verbose],
         description=function.__doc__,
     )
+    parser_new.add_argument(
+        "--since",
+        help="packages that became available since this date (YYYY-MM-DD)",
+    )
     parser_new.set_defaults(func=function)
 
     function = commands.newdetail
@@ -688,6 +757,10 @@ def main():
         description=function.__doc__,
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
+    parser_newdetail.add_argument(
+        "--since",
+        help="packages that became available since this date (YYYY-MM-DD)",
+    )
     parser_newdetail.set_defaults(func=function)
 
     function = commands.news
@@ -711,9 +784,10 @@ def main():
     function = commands.orphans
     parser_orphans = subparsers.add_parser(
         "orphans",
-        parents=[parser_teach],
+        parents=[parser_teach, parser_sections],
         aliases="orphaned listorphaned listorphans".split(),
         description=function.__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
     )
     parser_orphans.set_defaults(func=function)
 
@@ -739,6 +813,10 @@ def main():
         description=function.__doc__,
     )
     parser_policy.add_argument("packages", nargs="+")
+    parser_policy.add_argument(
+        "--json", action="store_true",
+        help="output the versions of each package as JSON",
+    )
     parser_policy.set_defaults(func=function)
 
     function = commands.purge
@@ -756,7 +834,7 @@ def main():
     parser_purgeorphans = subparsers.add_parser(
         "purgeorphans",
         aliases=["purge-orphans"],
-        parents=[parser_yesno, parser_teach],
+        parents=[parser_yesno, parser_teach, parser_sections],
         description=function.__doc__,
     )
     parser_purgeorphans.set_defaults(func=function)
@@ -776,8 +854,13 @@ def main():
         parents=[parser_teach],
         aliases="rbuilddep reversebuilddeps reverse-build-deps".split(),
         description=function.__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
     )
     parser_rbuilddeps.add_argument("package")
+    parser_rbuilddeps.add_argument(
+        "-r", "--recursive", action="store_true",
+        help="include packages that build-depend on those indirectly",
+    )
     parser_rbuilddeps.set_defaults(func=function)
 
     # README
@@ -815,7 +898,7 @@ def main():
     function = commands.recommended
     parser_recommended = subparsers.add_parser(
         "recommended",
-        parents=[parser_teach],
+        parents=[parser_verbose, parser_teach],
         description=function.__doc__,
     )
     parser_recommended.set_defaults(func=function)
@@ -842,10 +925,9 @@ def main():
     function = commands.reload
     parser_reload = subparsers.add_parser(
         "reload",
-        parents=[parser_teach],
+        parents=[parser_daemons, parser_teach],
         description=function.__doc__,
     )
-    parser_reload.add_argument("daemon")
     parser_reload.set_defaults(func=function)
 
     function = commands.remove
@@ -861,7 +943,7 @@ def main():
     parser_removeorphans = subparsers.add_parser(
         "removeorphans",
         aliases=["remove-orphans"],
-        parents=[parser_yesno],
+        parents=[parser_yesno, parser_sections, parser_teach],
         description=function.__doc__,
     )
     parser_removeorphans.set_defaults(func=function)
@@ -899,10 +981,9 @@ def main():
     function = commands.restart
     parser_restart = subparsers.add_parser(
         "restart",
-        parents=[parser_teach],
+        parents=[parser_daemons, parser_teach],
         description=function.__doc__,
     )
-    parser_restart.add_argument("daemon")
     parser_restart.set_defaults(func=function)
 
     # RMGROUP
@@ -1026,10 +1107,9 @@ def main():
     function = commands.start
     parser_start = subparsers.add_parser(
         "start",
-        parents=[parser_teach],
+        parents=[parser_daemons, parser_teach],
         description=function.__doc__,
     )
-    parser_start.add_argument("daemon")
     parser_start.set_defaults(func=function)
 
     # STATUS
@@ -1048,10 +1128,9 @@ def main():
     function = commands.stop
     parser_stop = subparsers.add_parser(
         "stop",
-        parents=[parser_teach],
+        parents=[parser_daemons, parser_teach],
         description=function.__doc__,
     )
-    parser_stop.add_argument("daemon")
     parser_stop.set_defaults(func=function)
 
     # SYSINFO
@@ -1061,6 +1140,15 @@ def main():
         "sysinfo",
         parents=[parser_teach],
         description=function.__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser_sysinfo.add_argument(
+        "--offline", action="store_true",
+        help="do not look up the external IP address",
+    )
+    parser_sysinfo.add_argument(
+        "--json", action="store_true",
+        help="output the information as JSON",
     )
     parser_sysinfo.set_defaults(func=function)
 
@@ -1070,6 +1158,18 @@ def main():
         parents=[parser_teach],
         description=function.__doc__,
     )
+    parser_aptlog.add_argument(
+        "--package",
+        help="only transactions acting on this package",
+    )
+    parser_aptlog.add_argument(
+        "--since",
+        help="only transactions started on or after this date (YYYY-MM-DD)",
+    )
+    parser_aptlog.add_argument(
+        "--user",
+        help="only transactions requested by this user",
+    )
     parser_aptlog.set_defaults(func=function)
 
     function = commands.listlog
@@ -1107,6 +1207,20 @@ def main():
     )
     parser_toupgrade.set_defaults(func=function)
 
+    function = commands.trimcache
+    parser_trimcache = subparsers.add_parser(
+        "trimcache",
+        aliases=["trim-cache"],
+        parents=[parser_teach],
+        description=function.__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser_trimcache.add_argument(
+        "-k", "--keep", type=int, default=2,
+        help="number of versions of each package to keep (default 2)",
+    )
+    parser_trimcache.set_defaults(func=function)
+
     function = commands.tutorial
     parser_tutorial = subparsers.add_parser(
         "tutorial",
@@ -1218,6 +1332,10 @@ def main():
         description=function.__doc__,
     )
     parser_versions.add_argument("packages", nargs="*")
+    parser_versions.add_argument(
+        "--json", action="store_true",
+        help="output the versions of each package as JSON",
+    )
     parser_versions.set_defaults(func=function)
 
     # WHICHPKG
@@ -1284,7 +1402,22 @@ def main():
     except AttributeError:
         pass
 
-    result.func(result)
+    if result.trace:
+        trace.destination = "-"
+    if result.trace_file:
+        trace.destination = result.trace_file
+    started = time.monotonic()
+    try:
+        with trace.span(result.func.__name__):
+            status = result.func(result)
+    finally:
+        if result.profile:
+            print("\n".join(perform.report(time.monotonic() - started)),
+                  file=sys.stderr)
+        trace.report()
+    # Commands may return an exit status.
+    if isinstance(status, int) and status:
+        sys.exit(status)
 
 if __name__ == '__main__':
     try:
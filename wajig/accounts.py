@@ -0,0 +1,285 @@
+# This file is part of wajig.  The copyright file is at debian/copyright.
+
+"""User accounts in bulk.
+
+The passwd and group files are parsed in-process (and again only when
+they change) so that names and memberships can be checked without
+forking. Accounts are created,
+have their passwords set, are locked, unlocked, and deleted through a
+single privileged command for all of the users rather than a chain of
+commands for each user."""
+
+import os
+import re
+import string
+import secrets
+import concurrent.futures
+
+import wajig.perform as perform
+
+PASSWD = "/etc/passwd"
+GROUP = "/etc/group"
+
+# The defaults of adduser, used where /etc/adduser.conf does not set
+# DHOME, DSHELL, or SKEL.
+
+ADDUSER_CONF = "/etc/adduser.conf"
+
+HOME = "/home"
+SHELL = "/bin/bash"
+SKEL = "/etc/skel"
+
+# The home directories deluser will not remove, as regular expressions,
+# used where /etc/deluser.conf does not set NO_DEL_PATHS.
+
+DELUSER_CONF = "/etc/deluser.conf"
+
+NO_DEL_PATHS = (r"^/bin$ ^/boot$ ^/dev$ ^/etc$ ^/initrd ^/lib ^/lost+found$ "
+                r"^/media$ ^/mnt$ ^/opt$ ^/proc$ ^/root$ ^/run$ ^/sbin$ "
+                r"^/srv$ ^/sys$ ^/tmp$ ^/usr$ ^/var$ ^/vmlinu")
+
+# WORKERS bounds the number of home directory backups run at once.
+
+WORKERS = 4
+
+PASSWORD_LENGTH = 20
+PASSWORD_CHARACTERS = string.ascii_letters + string.digits
+
+_loaded = dict()
+
+
+def _parse(path, fields):
+    """Return the records of the colon separated file PATH.
+
+    The records are cached against the file's modification time."""
+
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return dict()
+    if _loaded.get(path, (None,))[0] == mtime:
+        return _loaded[path][1]
+    records = dict()
+    with open(path) as f:
+        for line in f:
+            values = line.rstrip("\n").split(":")
+            if len(values) >= len(fields) and values[0]:
+                records.setdefault(values[0], dict(zip(fields, values)))
+    _loaded[path] = (mtime, records)
+    return records
+
+
+def users():
+    """Return a dict mapping user names to their passwd entries."""
+    return _parse(PASSWD, ("name", "password", "uid", "gid",
+                           "gecos", "home", "shell"))
+
+
+def groups():
+    """Return a dict mapping group names to their group entries."""
+    return _parse(GROUP, ("name", "password", "gid", "members"))
+
+
+_memberships = dict()
+
+
+def memberships():
+    """Return the members of each group and the groups of each user.
+
+    Returns two dicts: one mapping each group to the sorted names of
+    its members, including the users for whom it is the primary group,
+    and one mapping each user to the sorted names of their groups."""
+
+    users(), groups()
+    key = tuple(_loaded.get(path, (None,))[0] for path in (PASSWD, GROUP))
+    if _memberships.get("key") == key:
+        return _memberships["members"], _memberships["groups"]
+    members = {name: set(filter(None, group["members"].split(",")))
+               for name, group in groups().items()}
+    by_gid = {group["gid"]: name for name, group in groups().items()}
+    for name, user in users().items():
+        if user["gid"] in by_gid:
+            members[by_gid[user["gid"]]].add(name)
+    belongs = dict()
+    for group, names in members.items():
+        for name in names:
+            belongs.setdefault(name, set()).add(group)
+    members = {group: sorted(names) for group, names in members.items()}
+    belongs = {name: sorted(names) for name, names in belongs.items()}
+    _memberships.update(key=key, members=members, groups=belongs)
+    return members, belongs
+
+
+def primary_group(user):
+    """The name of the primary group of USER, from /etc/passwd, or None."""
+    entry = users().get(user)
+    if not entry:
+        return None
+    for name, group in groups().items():
+        if group["gid"] == entry["gid"]:
+            return name
+    return None
+
+
+def _settings(path, defaults):
+    """Return DEFAULTS updated with those set in the shell style PATH."""
+    settings = dict(defaults)
+    try:
+        with open(path) as f:
+            for line in f:
+                name, equals, value = line.strip().partition("=")
+                if equals and name.strip() in settings:
+                    value = value.strip().strip('"').strip("'")
+                    if value:
+                        settings[name.strip()] = value
+    except OSError:
+        pass
+    return settings
+
+
+def adduser_defaults():
+    """Return the home, shell, and skeleton directories of adduser."""
+    settings = _settings(ADDUSER_CONF,
+                         dict(DHOME=HOME, DSHELL=SHELL, SKEL=SKEL))
+    return settings["DHOME"], settings["DSHELL"], settings["SKEL"]
+
+
+def removable_home(user):
+    """The home directory of USER if deluser --remove-home removes it.
+
+    That is a directory owned by the user that none of the deluser
+    NO_DEL_PATHS expressions match; otherwise None."""
+
+    entry = users()[user]
+    home = entry["home"]
+    patterns = _settings(DELUSER_CONF,
+                         dict(NO_DEL_PATHS=NO_DEL_PATHS))["NO_DEL_PATHS"]
+    # The configuration escapes the dollar signs for the shell.
+    patterns = patterns.replace("\\$", "$").split()
+    try:
+        if not os.path.isdir(home) or \
+           str(os.stat(home).st_uid) != entry["uid"]:
+            return None
+    except OSError:
+        return None
+    if any(re.search(pattern, home) for pattern in patterns):
+        return None
+    return home
+
+
+def generate_password(length=PASSWORD_LENGTH):
+    return "".join(secrets.choice(PASSWORD_CHARACTERS) for _ in range(length))
+
+
+def provision(usernames, teach=False, noop=False):
+    """Create the accounts USERNAMES, each with a new password.
+
+    The new accounts are created by one newusers call and the
+    passwords of any that already exist are reset by one chpasswd
+    call. newusers does not populate the home directories, so the
+    skeleton directory of adduser is then copied into them all by one
+    more call. Returns a list of dicts with the user, password, and
+    result (created, reset, or failed) of each."""
+
+    home, shell, skel = adduser_defaults()
+    existing = users()
+    results = [dict(user=user, password=generate_password(),
+                    result="reset" if user in existing else "created")
+               for user in usernames]
+
+    created = [r["user"] for r in results if r["result"] == "created"]
+    create = "".join(
+        "{0}:{1}:::,,,:{2}/{0}:{3}\n".format(r["user"], r["password"],
+                                             home, shell)
+        for r in results if r["result"] == "created")
+    reset = "".join("{}:{}\n".format(r["user"], r["password"])
+                    for r in results if r["result"] == "reset")
+
+    failed = dict()
+    if create and perform.run(["/usr/sbin/newusers"], root=True,
+                              input=create, teach=teach, noop=noop):
+        failed["created"] = True
+    elif create and os.path.isdir(skel):
+        # xargs appends each user as $2.
+        populate = 'cp -RT --preserve=mode -- "$0" "$1/$2" && ' \
+                   'chown -R -- "$2": "$1/$2"'
+        for_each(["/bin/sh", "-c", populate, skel, home], created,
+                 teach, noop)
+    if reset and perform.run(["/usr/sbin/chpasswd"], root=True,
+                             input=reset, teach=teach, noop=noop):
+        failed["reset"] = True
+
+    if not noop:
+        existing = users()
+        for r in results:
+            if r["user"] not in existing or failed.get(r["result"]):
+                r["result"] = "failed"
+    return results
+
+
+def unknown(usernames):
+    """Return those of USERNAMES that have no account."""
+    existing = users()
+    return [user for user in usernames if user not in existing]
+
+
+def for_each(command, usernames, teach=False, noop=False):
+    """Run COMMAND (a list) once per user, all under a single xargs."""
+    stream = "".join(user + "\n" for user in usernames)
+    command = ["/usr/bin/xargs", "--no-run-if-empty", "--delimiter=\\n",
+               "--max-args=1"] + command
+    return perform.run(command, root=True, input=stream,
+                       teach=teach, noop=noop)
+
+
+def lock(usernames, teach=False, noop=False):
+    return for_each(["/usr/sbin/usermod", "--lock"], usernames, teach, noop)
+
+
+def unlock(usernames, teach=False, noop=False):
+    return for_each(["/usr/sbin/usermod", "--unlock"], usernames, teach, noop)
+
+
+def backup_homes(usernames, target, teach=False, noop=False):
+    """Save each user's home directory as TARGET/user.tar.bz2.
+
+    Only the home directories deluser would remove are saved. The
+    archives are created concurrently, unless each would ask for the
+    root password. Returns the users whose home directory could not be
+    saved."""
+
+    if not noop:
+        perform.authenticate()
+
+    def backup(user):
+        home = removable_home(user)
+        if not home:
+            return 0
+        archive = os.path.join(target, user + ".tar.bz2")
+        command = ["/bin/tar", "--create", "--bzip2", "--file", archive,
+                   "--directory", os.path.dirname(home) or "/",
+                   os.path.basename(home)]
+        return perform.run(command, root=True, teach=teach, noop=noop)
+
+    workers = 1 if perform.prompts() else WORKERS
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        results = pool.map(backup, usernames)
+    return [user for user, result in zip(usernames, results) if result]
+
+
+def delete(usernames, teach=False, noop=False):
+    """Delete the accounts and home directories of USERNAMES.
+
+    The home directories are first backed up into the current
+    directory (as deluser --backup would). Accounts whose backup
+    failed are not deleted. Returns two lists: the users not backed
+    up, and the users deluser failed to delete."""
+
+    failed = backup_homes(usernames, os.getcwd(), teach, noop)
+    remove = [user for user in usernames if user not in failed]
+    status = for_each(["/usr/sbin/deluser", "--remove-home"], remove,
+                      teach, noop)
+    if noop or not status:
+        return failed, []
+    existing = users()
+    return failed, [user for user in remove if user in existing]
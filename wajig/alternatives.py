@@ -0,0 +1,115 @@
+# This file is part of wajig.  The copyright file is at debian/copyright.
+
+"""The alternatives database of update-alternatives.
+
+The administrative files under /var/lib/dpkg/alternatives are parsed
+in-process into each link group's master link, slave links, mode, and
+candidates with their priorities. The result is kept in the wajig
+directory until update-alternatives next changes the database (it
+always replaces files, so the directory modification time changes)."""
+
+import os
+
+import wajig.util as util
+import wajig.perform as perform
+
+ADMIN_DIR = "/var/lib/dpkg/alternatives"
+ALTS_DIR = "/etc/alternatives"
+
+index_file = os.path.join(util.init_dir, "Alternatives")
+
+
+def parse(path):
+    """Return the link group in the administrative file PATH.
+
+    The group is a dict of its mode (auto or manual), master link,
+    slaves (a list of name and link pairs), and candidates (a list of
+    dicts with the path, priority, and slave paths of each)."""
+
+    with open(path) as f:
+        lines = f.read().split("\n")
+    mode, link = lines[0], lines[1]
+    position = 2
+    slaves = list()
+    while lines[position]:
+        slaves.append([lines[position], lines[position + 1]])
+        position += 2
+    position += 1
+    candidates = list()
+    while position < len(lines) and lines[position]:
+        path, priority = lines[position], lines[position + 1]
+        position += 2
+        candidates.append(dict(
+            path=path, priority=int(priority),
+            slaves=lines[position:position + len(slaves)],
+        ))
+        position += len(slaves)
+    return dict(mode=mode, link=link, slaves=slaves, candidates=candidates)
+
+
+def current(name):
+    """The alternative currently selected for the link group NAME."""
+    try:
+        return os.readlink(os.path.join(ALTS_DIR, name))
+    except OSError:
+        return None
+
+
+def key():
+    result = list()
+    for directory in (ADMIN_DIR, ALTS_DIR):
+        try:
+            result.append(os.stat(directory).st_mtime_ns)
+        except OSError:
+            result.append(None)
+    return result
+
+
+def load():
+    """Return a dict mapping link group names to their groups.
+
+    Each group also records the currently selected alternative."""
+
+    mtimes = key()
+    index = util.read_index(index_file)
+    if index.get("key") == mtimes and "groups" in index:
+        return index["groups"]
+    groups = dict()
+    if os.path.isdir(ADMIN_DIR):
+        for entry in os.scandir(ADMIN_DIR):
+            if entry.name.endswith(".dpkg-tmp") or not entry.is_file():
+                continue
+            try:
+                group = parse(entry.path)
+            except (OSError, IndexError, ValueError):
+                continue
+            group["current"] = current(entry.name)
+            groups[entry.name] = group
+    util.write_index(index_file, dict(key=mtimes, groups=groups))
+    return groups
+
+
+def best(group):
+    """The candidate update-alternatives chooses for GROUP in auto mode."""
+    if not group["candidates"]:
+        return None
+    return max(group["candidates"], key=lambda c: c["priority"])["path"]
+
+
+def set_auto(names, teach=False, noop=False):
+    """Put the link groups NAMES into auto mode with one privileged call.
+
+    Groups already in auto mode and selecting their best candidate are
+    left alone. Returns the names of the groups reset."""
+
+    groups = load()
+    resets = [name for name in names
+              if name in groups and best(groups[name]) and
+              (groups[name]["mode"] != "auto" or
+               groups[name]["current"] != best(groups[name]))]
+    if resets:
+        selections = "".join("{} auto {}\n".format(name, best(groups[name]))
+                             for name in resets)
+        perform.run(["/usr/bin/update-alternatives", "--set-selections"],
+                    root=True, input=selections, teach=teach, noop=noop)
+    return resets
@@ -0,0 +1,133 @@
+# This file is part of wajig.  The copyright file is at debian/copyright.
+
+"""Index of the .deb files in APT's download cache.
+
+The download cache is scanned with os.scandir() and each file name is
+split into its (package, version, architecture). The index is kept in
+the wajig directory and is only refreshed when the cache directory's
+modification time changes, and then only new files are examined."""
+
+import os
+import functools
+import urllib.parse
+
+import apt_pkg
+
+import wajig.util as util
+
+index_file = os.path.join(util.init_dir, "Archives")
+
+_index = dict()
+
+
+def archives_dir():
+    return apt_pkg.config.find_dir("Dir::Cache::Archives")
+
+
+def parse_filename(filename):
+    """Split a .deb file name into (package, version, architecture).
+
+    Returns None for names that do not follow the package_version_arch
+    convention. The epoch colon is stored in file names as %3a."""
+
+    if not filename.endswith(".deb"):
+        return None
+    parts = filename[:-len(".deb")].split("_")
+    if len(parts) != 3:
+        return None
+    package, version, arch = parts
+    return package, urllib.parse.unquote(version), arch
+
+
+def load():
+    """Return a dict mapping cached file names to their entries.
+
+    An entry is a dict with the package, version, arch, and size of
+    the file."""
+
+    directory = archives_dir()
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+    except FileNotFoundError:
+        return dict()
+
+    if not _index:
+        _index.update(util.read_index(index_file))
+    if _index.get("directory") == directory and _index.get("mtime") == mtime:
+        return _index["entries"]
+
+    known = _index.get("entries", {}) if \
+        _index.get("directory") == directory else {}
+    entries = dict()
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name in known:
+                entries[entry.name] = known[entry.name]
+                continue
+            parsed = parse_filename(entry.name)
+            if not parsed or not entry.is_file():
+                continue
+            package, version, arch = parsed
+            entries[entry.name] = dict(package=package, version=version,
+                                       arch=arch, size=entry.stat().st_size)
+
+    _index.update(directory=directory, mtime=mtime, entries=entries)
+    util.write_index(index_file, _index)
+    return entries
+
+
+def by_package():
+    """Return a dict mapping (package, arch) to cached file names.
+
+    The file names are ordered from newest to oldest version."""
+
+    entries = load()
+    groups = dict()
+    for filename, entry in entries.items():
+        groups.setdefault((entry["package"], entry["arch"]), []).append(filename)
+    newest = functools.cmp_to_key(
+        lambda a, b: apt_pkg.version_compare(entries[b]["version"],
+                                             entries[a]["version"]))
+    for filenames in groups.values():
+        filenames.sort(key=newest)
+    return groups
+
+
+def latest(package):
+    """Return the path of the newest cached .deb of PACKAGE, or None.
+
+    PACKAGE may be given as name:arch. Otherwise only files for the
+    native architecture (or for all) are considered, so a foreign
+    architecture's file is not picked on a multiarch system."""
+
+    package, _, arch = package.partition(":")
+    arches = (arch or apt_pkg.config.find("APT::Architecture"), "all")
+    entries = load()
+    best = None
+    for filename, entry in entries.items():
+        if entry["package"] != package or entry["arch"] not in arches:
+            continue
+        if best is None or apt_pkg.version_compare(
+                entry["version"], entries[best]["version"]) > 0:
+            best = filename
+    return os.path.join(archives_dir(), best) if best else None
+
+
+def find(package, version, arch=None):
+    """Return the path of the cached .deb of PACKAGE VERSION, or None."""
+    for filename, entry in load().items():
+        if entry["package"] == package and entry["version"] == version \
+           and (arch is None or entry["arch"] in (arch, "all")):
+            return os.path.join(archives_dir(), filename)
+    return None
+
+
+def surplus(keep):
+    """Return paths of cached files beyond the newest KEEP of each package."""
+    return [os.path.join(archives_dir(), filename)
+            for filenames in by_package().values()
+            for filename in filenames[keep:]]
+
+
+def total_size():
+    return sum(entry["size"] for entry in load().values())
@@ -49,7 +49,7 @@ listsections|liststatus|localupgrade|madison|move|new|newdetail|news|nonfree|orp
 purge|purgeorphans|purgeremoved|rbuilddeps|readme|reboot|recdownload|recommended|reconfigure|\
 reinstall|reload|remove|removeorphans|repackage|reportbug|repos|restart|rmrepo|rpm2deb|\
 rpminstall|safeupgrade|safe-upgrade|search|\
-searchapt|show|sizes|snapshot|source|start|status|stop|sysinfo|tasksel|todo|toupgrade|\
+searchapt|show|sizes|snapshot|source|start|status|stop|sysinfo|tasksel|todo|toupgrade|trimcache|\
 tutorial|unhold|unofficial|update|updatealternatives|updatepciids|updateusbids|upgrade|upgradesecurity|\
 verify|version|versions|whichpackage) ]];
          then special=${COMP_WORDS[i]}
@@ -135,7 +135,7 @@ verify|version|versions|whichpackage) ]];
 		  rmrepo rpm2deb rpminstall safeupgrade safe-upgrade
 		  search searchapt show sizes snapshot source start
 		  status stop sysinfo tasksel todo toupgrade
-		  to-upgrade tutorial unhold unofficial update
+		  to-upgrade trimcache trim-cache tutorial unhold unofficial update
 		  updatealternatives updatepciids updateusbids
 		  upgradable upgrade upgradesecurity verify version
 		  versions whichpackage)
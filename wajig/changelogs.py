@@ -0,0 +1,101 @@
+# This file is part of wajig.  The copyright file is at debian/copyright.
+
+"""Cache of the Debian changelogs fetched from the archive.
+
+A changelog only changes with a new version of its source package, so
+each one fetched is kept under ~/.wajig/changelogs keyed by the source
+package and version. python-apt stops the changelog at the installed
+version, so that is part of the key too. Unlike the other wajig files
+the cache is not host specific: hosts sharing a home directory share
+their changelogs. The least recently used changelogs are removed once
+the cache grows beyond MAX_SIZE bytes."""
+
+import os
+import re
+import socket
+
+cache_dir = os.path.join(os.path.expanduser("~/.wajig"), "changelogs")
+
+MAX_SIZE = 32 * 1024 * 1024
+
+# python-apt reports a changelog it could not fetch with a message in
+# the user's language rather than an error, so only a text starting
+# with a changelog entry (package (version) distributions; ...) is
+# taken to be a changelog and cached.
+
+ENTRY = re.compile(r"[a-z0-9][a-z0-9+.-]* \([^ ()]+\) [^;\n]*;")
+
+
+def path(source, version, installed=None):
+    # An epoch colon is quoted as in archive file names.
+    filename = "{}_{}_{}".format(source, version, installed or "none")
+    return os.path.join(cache_dir, filename.replace(":", "%3a"))
+
+
+def get(source, version, installed=None):
+    """Return the cached changelog of SOURCE at VERSION, or None.
+
+    INSTALLED is the installed version the changelog stops at."""
+    filename = path(source, version, installed)
+    try:
+        with open(filename, encoding="utf-8") as f:
+            text = f.read()
+        os.utime(filename)
+    except OSError:
+        return None
+    return text
+
+
+def put(source, version, installed, text):
+    """Cache TEXT as the changelog of SOURCE at VERSION."""
+    filename = path(source, version, installed)
+    # Unique to this host and process as the cache may be shared.
+    partial = "{}.{}.{}".format(filename, socket.gethostname(), os.getpid())
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(partial, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(partial, filename)
+    except OSError:
+        return
+    evict()
+
+
+def evict(limit=MAX_SIZE):
+    """Remove the least recently used changelogs beyond LIMIT bytes."""
+    try:
+        entries = [entry for entry in os.scandir(cache_dir) if entry.is_file()]
+    except OSError:
+        return
+    entries = [(entry.stat(), entry.path) for entry in entries]
+    total = sum(stat.st_size for stat, _ in entries)
+    for stat, filename in sorted(entries, key=lambda e: e[0].st_mtime):
+        if total <= limit:
+            break
+        try:
+            os.remove(filename)
+        except OSError:
+            continue
+        total -= stat.st_size
+
+
+def changelog(package, uri=None, offline=False):
+    """Return the changelog of the candidate version of PACKAGE.
+
+    PACKAGE is an apt.Package. The changelog is fetched (from URI, a
+    template as for apt.Package.get_changelog) only when it is not
+    already cached. With OFFLINE only the cache is used."""
+
+    candidate = package.candidate
+    source, version = candidate.source_name, candidate.source_version
+    installed = package.installed.version if package.installed else None
+    text = get(source, version, installed)
+    if text is not None:
+        return text
+    if offline:
+        return ("Failed to download the list of changes: "
+                "offline and {} {} is not cached".format(source, version))
+    text = package.get_changelog(uri) if uri else package.get_changelog()
+    if ENTRY.match(text.lstrip()):
+        put(source, version, installed, text)
+    return text
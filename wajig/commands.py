@@ -7,7 +7,9 @@
 import os
 import re
 import string
-import random
+import shlex
+import secrets
+import json
 import inspect
 import tempfile
 import subprocess
@@ -15,12 +17,26 @@ import urllib.request
 import webbrowser
 import shutil
 
-import apt
+import apt_pkg
 
 # wajig modules
 import wajig.perform as perform
 import wajig.util as util
+import wajig.status as dpkgstatus
+import wajig.accounts as accounts
+import wajig.depgraph as depgraph
+import wajig.alternatives as alternatives
+import wajig.archives as archives
+import wajig.changelogs as changelogs
 import wajig.debfile as debfile
+import wajig.docs as docs
+import wajig.download as downloader
+import wajig.history as history
+import wajig.services as services
+import wajig.sources as sources
+import wajig.versions as versioninfo
+import wajig.sysinfo as system
+import wajig.trace as trace
 
 from wajig.constants import APP, VERSION
 
@@ -46,6 +62,16 @@ def addgroup(args):
     users super user access through the `sudo` command.
 
     $ wajig addgroup fred sudo"""
+    members, _ = accounts.memberships()
+    if args.username not in accounts.users():
+        print(f"wajig addgroup: error: no such user '{args.username}'")
+        return
+    if args.group not in members:
+        print(f"wajig addgroup: error: no such group '{args.group}'")
+        return
+    if args.username in members[args.group]:
+        print(f"User '{args.username}' is already a member of '{args.group}'.")
+        return
     cmd = f'/usr/sbin/adduser {args.username} {args.group}'
     perform.execute(cmd, root=True, teach=args.teach, noop=args.noop)
 
@@ -96,7 +122,11 @@ def adduser(args):
     If a number is provided then that many new users are created and
     the output will be username:password.
 
-    $ wajig adduser 5"""
+    $ wajig adduser 5
+
+    All the accounts are created together (through newusers) and the
+    password of any user that already exists is reset. Use --json for
+    the result of each user."""
     number = args.number
     username = args.username
 
@@ -112,55 +142,80 @@ def adduser(args):
     elif args.file:
         if not os.path.exists(args.file):
             print(f"wajig adduser: error: file not found '{args.file}'")
+            return()
         elif not os.access(args.file, os.R_OK):
             print(f"wajig adduser: error: file not accessible '{args.file}'.")
+            return()
         else:
-            usernames = []
-            for u in open(args.file, 'r'):
-                usernames.append(u.strip())
+            with open(args.file) as f:
+                username = [u.strip() for u in f if u.strip()]
 
-    elif number and re.match(r"^[0-9]+$", number):
+    if number and not args.file:
         usernames = []
         for i in range(int(number)):
-            code = ''.join(random.choice(string.ascii_lowercase) for _ in range(7))
+            code = ''.join(secrets.choice(string.ascii_lowercase) for _ in range(7))
             usernames.append(f"u{code}")
 
     else:
+        usernames = []
         for u in username:
             if not re.match(r"^[a-z][-a-z0-9_]*$", u):
                 print(f"wajig adduser: error: bad user name '{u}' " +
                       f"must start with lowercase then",
                       f"alphanumerics or underscore.")
-        usernames = username
-
-    util.requires_package("pwgen")
-    created = []
-    for u in usernames:
-        cmd = f'adduser {u} --gecos "" --disabled-password'
-        perform.execute(cmd, root=True, teach=args.teach, noop=args.noop)
-
-        cmd = f"pwgen -s 20 1"
-        password = perform.execute(cmd, pipe=True, teach=args.teach, noop=args.noop)
-        if password: password = password.readline().strip()
+            else:
+                usernames.append(u)
 
-        cmd = f'echo "{u}:{password}" | sudo chpasswd'
-        perform.execute(cmd, root=True, teach=args.teach, noop=args.noop)
+    results = accounts.provision(usernames, teach=args.teach, noop=args.noop)
 
-        print()
-        created.append(f"{u}:{password}")
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            if r["result"] == "failed":
+                print(f"wajig adduser: error: failed to add user '{r['user']}'")
+            else:
+                print(f"{r['user']}:{r['password']}")
 
-    print("\n".join(created))
 
 def aptlog(args):
-    """Display APT log file"""
-    perform.execute("cat /var/log/apt/history.log")
+    """Display APT log file
+
+    The transactions of the current and rotated APT history logs are
+    listed, oldest first. Use --package, --since (YYYY-MM-DD) and
+    --user to select transactions."""
+    since = args.since
+    if since:
+        try:
+            since = util.parse_date(since)
+        except ValueError:
+            print(f"wajig aptlog: error: invalid date '{args.since}'")
+            return
+    transactions = history.search(args.package, since, args.user)
+    for line in history.report(transactions):
+        try:
+            print(line)
+        except BrokenPipeError:
+            return
 
 
 def autoalts(args):
-    """Mark the Alternative to be auto-set (using set priorities)"""
-    perform.execute(
-        "/usr/bin/update-alternatives --auto " + args.alternative, root=True, teach=args.teach, noop=args.noop
-    )
+    """Mark the Alternative to be auto-set (using set priorities)
+
+    Any number of alternatives may be given, or --all for every
+    alternative. Those not already selecting their highest priority
+    choice in auto mode are reset by one call of update-alternatives."""
+    groups = alternatives.load()
+    names = sorted(groups) if args.all else args.alternative
+    if not names:
+        print("wajig autoalts: error: no alternatives given (or use --all)")
+        return
+    unknown = [name for name in names if name not in groups]
+    if unknown:
+        print("wajig autoalts: error: no alternatives for " + " ".join(unknown))
+        return
+    for name in alternatives.set_auto(names, teach=args.teach, noop=args.noop):
+        print(name, "->", alternatives.best(groups[name]))
 
 
 def autodownload(args):
@@ -220,13 +275,16 @@ def changelog(args):
          changelog - if there's newer entries, mention failure to retrieve
       -v changelog - if there's newer entries, mention failure to retrieve, and
                      proceed to display complete local changelog
+
+    Changelogs fetched are cached under ~/.wajig/changelogs for each
+    source package version. With --offline only the cache is used.
     """
 
-    package = util.package_exists(apt.Cache(), args.package)
+    package = util.package_exists(util.apt_cache(), args.package)
     changelog = "{:=^79}\n".format(" {} ".format(args.package))  # header
 
     try:
-        changelog += package.get_changelog()
+        changelog += changelogs.changelog(package, args.uri, args.offline)
     except AttributeError:
         # This is caught so as to avoid an ugly python-apt trace; it's a bug
         # that surfaces when:
@@ -246,25 +304,19 @@ def changelog(args):
         changelog += ".\nYou are likely running the latest version.\n"
         if not args.verbose:
             changelog += help_message
-    if not args.verbose:
-        print(changelog)
-    else:
-        tmp = tempfile.mkstemp()[1]
-        with open(tmp, "w") as f:
-            if package.is_installed:
-                changelog += "{:=^79}\n".format(" local changelog ")
-            f.write(changelog)
-        if package.is_installed:
-            cmd = util.local_changelog(args.package, tmp)
-            if not cmd:
-                return
-            perform.execute(cmd)
-        with open(tmp) as f:
-            for line in f:
-                try:
-                    print(line, end="")
-                except BrokenPipeError:
-                    return
+    if package.is_installed and args.verbose:
+        changelog += "{:=^79}\n".format(" local changelog ")
+    try:
+        print(changelog, end="" if args.verbose else "\n")
+    except BrokenPipeError:
+        return
+    if package.is_installed and args.verbose:
+        path = docs.changelog(args.package)
+        if path:
+            docs.stream(path)
+        else:
+            print("Package", args.package,
+                  "is likely broken (changelog not found)!")
 
 # CLEAN
 
@@ -306,14 +358,22 @@ def dailyupgrade(args):
 def deluser(args):
     """Delete user accounts
 
-With a list of usernames, delete each user.
+With a list of usernames, delete each user. The home directory of
+each user is first saved as user.tar.bz2 in the current directory.
 
   $ wajig deluser fred susan
 """
-    for u in args.username:
-        cmd = f"sudo deluser --remove-home --backup {u}"
-        perform.execute(cmd, root=True, teach=args.teach, noop=args.noop)
-        if not u == args.username[-1]: print()
+    missing = accounts.unknown(args.username)
+    if missing:
+        print("wajig deluser: error: no such user: " + ", ".join(missing))
+        return
+    unsaved, undeleted = accounts.delete(args.username, teach=args.teach,
+                                         noop=args.noop)
+    for u in unsaved:
+        print(f"wajig deluser: error: home of '{u}' not backed up; not deleted")
+    for u in undeleted:
+        print(f"wajig deluser: error: failed to delete user '{u}'")
+    return int(bool(unsaved or undeleted))
 
 
 def dependents(args):
@@ -335,16 +395,18 @@ def dependents(args):
         "Enhances",
     ]
 
-    cache = apt.cache.Cache()
-    package = util.package_exists(cache, args.package)
+    package = util.find_package(args.package)
     dependents = {name : [] for name in DEPENDENCY_TYPES}
 
-    for key in cache.keys():
-        other_package = cache[key]
-        for dependency_type, specific_dependents in dependents.items():
-            if package.shortname in \
-            util.extract_dependencies(other_package, dependency_type):
-                specific_dependents.append(other_package.shortname)
+    with trace.span("dependents walk"):
+        for other_package in util.pkg_cache().packages:
+            if not other_package.has_versions:
+                continue
+            trace.count("packages visited")
+            for dependency_type, specific_dependents in dependents.items():
+                if package.name in \
+                util.dependencies(other_package, dependency_type):
+                    specific_dependents.append(other_package.name)
 
     for dependency_type, specific_dependents in dependents.items():
         if specific_dependents:
@@ -377,10 +439,11 @@ def disable(args):
     password file.  With a list of usernames, diable each user.
 
     $ wajig disable fred susan"""
-    for u in args.username:
-        cmd = f"sudo usermod --lock {u}"
-        perform.execute(cmd, root=True, teach=args.teach, noop=args.noop)
-        if not u == args.username[-1]: print()
+    missing = accounts.unknown(args.username)
+    if missing:
+        print("wajig disable: error: no such user: " + ", ".join(missing))
+        return
+    accounts.lock(args.username, teach=args.teach, noop=args.noop)
 
 
 def distupgrade(args):
@@ -397,7 +460,7 @@ def distupgrade(args):
     if args.backup:
         util.requires_package("dpkg-repack")
         util.requires_package("fakeroot")
-        util.backup_before_upgrade(packages, distupgrade=True)
+        util.backup_before_upgrade(packages)
     cmd = "/usr/bin/apt --show-upgraded {} {} {} ".format(
         args.local, args.yes, args.noauth
     )
@@ -431,11 +494,11 @@ def enable(args):
     the password file.  With a list of usernames, enable each user.
 
     $ wajig enable mary john"""
-    for u in args.username:
-        cmd = f"sudo usermod --unlock {u}"
-        perform.execute(cmd, root=True, teach=args.teach, noop=args.noop)
-        if not u == args.username[-1]:
-            print()
+    missing = accounts.unknown(args.username)
+    if missing:
+        print("wajig enable: error: no such user: " + ", ".join(missing))
+        return
+    accounts.unlock(args.username, teach=args.teach, noop=args.noop)
 
 
 def extract(args):
@@ -471,20 +534,20 @@ def force(args):
     """
 
     cmd = "/usr/bin/dpkg --install --force overwrite --force depends "
-    archives = "/var/cache/apt/archives/"
+    archive_dir = archives.archives_dir()
 
     # For a .deb file we simply force install it.
     if args.packages[0].endswith(".deb"):
         for package in args.packages:
             if os.path.exists(package):
                 cmd += "'" + package + "' "
-            elif os.path.exists(archives + package):
-                cmd += "'" + archives + package + "' "
+            elif os.path.exists(archive_dir + package):
+                cmd += "'" + archive_dir + package + "' "
             else:
                 message = ("File {} not found. "
                            "Searched current directory and {}."
                            "Please confirm the location and try again.")
-                print(message.format(package, archives))
+                print(message.format(package, archive_dir))
                 return()
     else:
         # Package names rather than a specific deb package archive
@@ -492,10 +555,7 @@ def force(args):
         for package in args.packages:
             # Identify the latest version of the package available in
             # the download archive, if there is any there.
-            lscmd = "ls {} | grep -E '^{}_' | sort -k 1b,1 | tail -n -1"
-            lscmd = lscmd.format(archives, package)
-            matches = perform.execute(lscmd, pipe=True)
-            debpkg = matches.readline().strip()
+            debpkg = archives.latest(package)
 
             if not debpkg:
                 dlcmd = (
@@ -503,24 +563,24 @@ def force(args):
                     "install '{}'"
                 ).format(package)
                 perform.execute(dlcmd, root=True)
-                matches = perform.execute(lscmd, pipe=True)
-                debpkg = matches.readline().strip()
+                debpkg = archives.latest(package)
+            if not debpkg:
+                print("Package {} not found in {}.".format(package,
+                                                           archive_dir))
+                return()
 
             # Force install the package from the download archive.
-            cmd += "'" + archives + debpkg + "' "
+            cmd += "'" + debpkg + "' "
 
     perform.execute(cmd, root=True, log=True, teach=args.teach, noop=args.noop)
 
 
 def hold(args):
     """Place packages on hold (so they will not be upgraded)"""
-    for package in args.packages:
-        # The dpkg needs sudo but not the echo.
-        # Do all of it as root then!
-        cmd = '/bin/echo "{} hold" | /usr/bin/dpkg --set-selections'
-        perform.execute(cmd.format(package), root=True, teach=args.teach, noop=args.noop)
+    dpkgstatus.set_selections(args.packages, "hold",
+                              teach=args.teach, noop=args.noop)
     print("The following packages are on hold:")
-    perform.execute("dpkg --get-selections | grep -E 'hold$' | cut -f1", teach=args.teach, noop=args.noop)
+    print("\n".join(dpkgstatus.holds()))
 
 
 def info(args):
@@ -540,7 +600,9 @@ def install(args):
     * specifying a .deb file will also try to satisfy that deb's dependencies;
     * one can specify multiple files with --fileinput option
     * specifying a url will try fetch the file from the internet, and keep it
-      in "~/.wajig/$HOSTNAME"
+      in "~/.wajig/$HOSTNAME"; several urls are fetched at once, interrupted
+      downloads are resumed, and a '#sha256=<digest>' suffix on a url
+      has the file verified (and not fetched again once it is)
 
     example:
     $ wajig install a b_1.0_all.deb https://example.com/c_1.0_all.deb
@@ -552,23 +614,21 @@ def install(args):
     packages = util.consolidate_package_names(args)
 
     online_files = [
-        package for package in packages if
-        package.startswith(("https://", "http://", "ftp://"))
+        package for package in packages if downloader.is_url(package)
     ]
-    deb_files = list()
+    urls = list()
     for package in online_files:
-        if not package.endswith(".deb"):
+        if not downloader.split_url(package)[1].endswith(".deb"):
             print("A valid .deb file should have a '.deb' extension")
             continue
-        filename = os.path.join(util.init_dir, package.split("/")[-1])
-        try:
-            response = urllib.request.urlopen(package)
-        except urllib.error.HTTPError as error:
-            print("{}; is '{}' the correct url?".format(error.reason, package))
-        else:
-            with open(filename, "wb") as f:
-                f.write(response.read())
-            deb_files.append(filename)
+        urls.append(package)
+    deb_files, failed = downloader.fetch_all(urls, util.init_dir)
+    for package, error in failed:
+        if isinstance(error, downloader.DuplicateError):
+            print("{}; '{}' not fetched".format(error, package))
+            continue
+        reason = getattr(error, "reason", error)
+        print("{}; is '{}' the correct url?".format(reason, package))
 
     deb_files.extend([
         package for package in packages if package.endswith(".deb")
@@ -590,12 +650,10 @@ def install(args):
 
 def installsuggested(args):
     """Install a package and its Suggests dependencies"""
-    cache = apt.cache.Cache()
-    package = util.package_exists(cache, args.package,
-                                  ignore_virtual_packages=True)
-    dependencies = list(util.extract_dependencies(package, "Suggests"))
+    package = util.find_package(args.package, ignore_virtual_packages=True)
+    dependencies = list(util.dependencies(package, "Suggests"))
     for n, dependency in enumerate(dependencies):
-        dependencies[n] = util.package_exists(cache, dependency).shortname
+        dependencies[n] = util.find_package(dependency).name
     dependencies = " ".join(dependencies)
     command = "/usr/bin/apt-get {} {} {} --auto-remove install {} {}"
     command = command.format(args.recommends, args.yes, args.noauth,
@@ -642,27 +700,41 @@ def listall(args):
 
 def listcache(args):
     """List the contents of the download cache"""
-    command = "printf 'Found %d files %s in the cache.\n\n'\
-           $(ls /var/cache/apt/archives/ | wc -l) \
-           $(ls -sh /var/cache/apt/archives/ | head -1 | awk '{print $2}')"
-    perform.execute(command)
-    command = "ls /var/cache/apt/archives/"
-    if args.pattern:
-        command = "{} | grep -E '{}'".format(command, args.pattern)
-    perform.execute(command, teach=args.teach, noop=args.noop)
+    try:
+        pattern = re.compile(args.pattern or "")
+    except re.error as error:
+        print(f"wajig listcache: error: bad pattern '{args.pattern}': {error}")
+        return 1
+    files = archives.load()
+    print("Found {} files {} in the cache.\n".format(
+        len(files), util.human_size(archives.total_size())))
+    for filename in sorted(files):
+        if pattern.search(filename):
+            print(filename)
 
 
 def listalternatives(args):
-    """List the objects that can have alternatives configured"""
-    command = ("/bin/ls /etc/alternatives/ | "
-               r"/bin/grep -E -v '(\.gz|README)$'")
-    perform.execute(command, teach=args.teach, noop=args.noop)
+    """List the objects that can have alternatives configured
+
+    With --verbose also list the mode, current choice and the choices
+    with their priorities."""
+    for name, group in sorted(alternatives.load().items()):
+        if not args.verbose:
+            print(name)
+            continue
+        print("{} ({}) {} -> {}".format(name, group["mode"], group["link"],
+                                       group["current"] or "none"))
+        for candidate in group["candidates"]:
+            print("  {:>6} {}".format(candidate["priority"],
+                                      candidate["path"]))
 
 
 def listdaemons(args):
-    """List the daemons that wajig can start, stop, restart, or reload"""
-    util.requires_package("chkconfig")
-    perform.execute("chkconfig", teach=args.teach, noop=args.noop)
+    """List the daemons that wajig can start, stop, restart, or reload
+
+    Each is listed with whether it is enabled, disabled, or masked."""
+    for name, service in sorted(services.load().items()):
+        print(f"{name:<{util.CW}} {service['state']}")
 
 
 def listfiles(args):
@@ -691,19 +763,20 @@ def listgroups(args):
     the named group are listed.
 
     $ wajig listgroups sudo"""
+    members, _ = accounts.memberships()
     group = args.group
     if not group:
-        cmd = "cat /etc/group | cut -d':' -f1 | sort"
+        print("\n".join(sorted(members)))
+    elif group not in members:
+        print(f"wajig listgroups: error: no such group '{group}'")
     else:
-        util.requires_package("members")
-        cmd = f"members {group}"
-    perform.execute(cmd, teach=args.teach, noop=args.noop)
+        print(" ".join(members[group]))
 
 
 def listhold(args):
     """List packages that are on hold (i.e. those that won't be upgraded)"""
-    cmd = "dpkg --get-selections | grep -E 'hold$' | cut -f1"
-    perform.execute(cmd, teach=args.teach, noop=args.noop)
+    for package in dpkgstatus.holds():
+        print(package)
 
 
 def listinstalled(args):
@@ -722,7 +795,11 @@ def listlog(args):
 
 def listnames(args):
     """List all known packages; optionally filter the list with a pattern"""
-    util.do_listnames(args.pattern)
+    for name in util.do_listnames(args.pattern, args.teach, args.noop):
+        try:
+            print(name, end="")
+        except BrokenPipeError:
+            return
 
 # LISTPACKAGES
 
@@ -764,20 +841,24 @@ def listsection(args):
 
     Note: Use the LISTSECTIONS command for a list of Debian Sections
     """
-    cache = apt.cache.Cache()
-    for package in cache.keys():
-        package = cache[package]
-        if package.section == args.section:
-            print(package.name)
+    with trace.span("listsection walk"):
+        for package in util.pkg_cache().packages:
+            if not package.has_versions:
+                continue
+            trace.count("packages visited")
+            if util.section(package) == args.section:
+                print(package.get_fullname(True))
 
 
 def listsections(args):
     """List all available sections"""
-    cache = apt.cache.Cache()
     sections = list()
-    for package in cache.keys():
-        package = cache[package]
-        sections.append(package.section)
+    with trace.span("listsections walk"):
+        for package in util.pkg_cache().packages:
+            if not package.has_versions:
+                continue
+            trace.count("packages visited")
+            sections.append(util.section(package))
     sections = set(sections)
     for section in sections:
         print(section)
@@ -795,6 +876,16 @@ def liststatus(args):
 
 def localupgrade(args):
     """Upgrade using only packages that are already downloaded"""
+    installed = dpkgstatus.installed()
+    newer = [entry["package"] for entry in archives.load().values()
+             if entry["package"] in installed
+             and entry["arch"] in (installed[entry["package"]].get(
+                 "Architecture"), "all")
+             and apt_pkg.version_compare(
+                 entry["version"], installed[entry["package"]]["Version"]) > 0]
+    if not newer and not args.noop:
+        print("No upgrades found in the download cache.")
+        return
     cmd = (
         "/usr/bin/apt-get --no-download --ignore-missing "
         "--show-upgraded upgrade"
@@ -803,9 +894,11 @@ def localupgrade(args):
 
 
 def madison(args):
-    """Runs the madison command of apt-cache"""
-    command = "apt-cache madison " + " ".join(set(args.packages))
-    perform.execute(command, teach=args.teach, noop=args.noop)
+    """List the available versions of packages and where they come from
+
+    The output follows that of apt-cache madison. Use --json for the
+    full versions report."""
+    versioninfo.show(args, versioninfo.madison_lines)
 
 
 def move(args):
@@ -815,8 +908,19 @@ def move(args):
 
 
 def new(args):
-    """Display newly-available packages"""
-    util.newly_available(args.verbose)
+    """Display newly-available packages
+
+    These are the packages that were new at the last update. Each
+    update's new packages are kept, so with --since (YYYY-MM-DD) those
+    that became available at any update since then are displayed."""
+    since = args.since
+    if since:
+        try:
+            since = util.parse_date(since)
+        except ValueError:
+            print(f"wajig new: error: invalid date '{args.since}'")
+            return
+    util.newly_available(args.verbose, since)
 
 
 def newdetail(args):
@@ -824,12 +928,13 @@ def newdetail(args):
 
     This produces the same output as 'wajig new --verbose'
     """
-    util.newly_available(verbose=True)
+    args.verbose = True
+    new(args)
 
 
 def news(args):
     """Display the NEWS file of a given package"""
-    util.display_sys_docs(args.package, "NEWS.Debian NEWS".split())
+    docs.show(args.package, "NEWS.Debian NEWS".split())
 
 
 def nonfree(args):
@@ -839,9 +944,14 @@ def nonfree(args):
 
 
 def orphans(args):
-    """List libraries not required by any installed package """
-    util.requires_package("deborphan")
-    perform.execute("deborphan", teach=args.teach, noop=args.noop)
+    """List libraries not required by any installed package
+
+    An orphan is an automatically installed package that no manually
+    installed, essential, or important package needs, directly or
+    indirectly. Only libraries are listed unless --all or --section
+    is given."""
+    for package in depgraph.orphans(args.sections):
+        print(package)
 
 
 # PASSWORD
@@ -872,8 +982,11 @@ special characters (punctuation).:
 # POLICY
 
 def policy(args):
-    """From preferences file show priorities/policy (available)"""
-    perform.execute("apt-cache policy " + " ".join(args.packages), teach=args.teach, noop=args.noop)
+    """From preferences file show priorities/policy (available)
+
+    The output follows that of apt-cache policy. Use --json for the
+    full versions report."""
+    versioninfo.show(args, versioninfo.policy_lines)
 
 
 def purge(args):
@@ -887,12 +1000,7 @@ def purge(args):
 
 def purgeorphans(args):
     """Purge orphaned libraries (not required by installed packages)"""
-    # Deborphans does not require root, but dpkg does,
-    # so build up the orphans list first, then pass that to dpkg.
-    util.requires_package("deborphan")
-    packages = ""
-    for package in perform.execute("deborphan", pipe=True):
-        packages += " " + package.strip()
+    packages = " ".join(depgraph.orphans(args.sections))
     if packages:
         command = "/usr/bin/apt-get --auto-remove purge {} {}"
         command = command.format(args.yes, packages)
@@ -901,29 +1009,23 @@ def purgeorphans(args):
 
 def purgeremoved(args):
     """Purge all packages marked as deinstall"""
-    packages = ""
-    cmd = (
-        "dpkg-query --show "
-        "--showformat='${Package}:${Architecture}\t${Status}\n' | "
-        "grep -E \"deinstall ok config-files\" | cut -f 1 "
-    )
-    packages = perform.execute(cmd, pipe=True, teach=args.teach, noop=args.noop)
-    if packages:
-        packages = " ".join(packages)
-        packages = " ".join(packages.split())
-        perform.execute("/usr/bin/apt-get purge " + packages,
+    packages = dpkgstatus.in_state("config-files")
+    if not packages:
+        print("No removed packages with configuration files remain.")
+        return
+    command = "/usr/bin/apt-get purge "
+    for batch in util.batches(packages, command):
+        perform.execute(command + " ".join(batch),
                         root=True, log=True, teach=args.teach, noop=args.noop)
 
 
 def rbuilddeps(args):
-    """Display the packages which build-depend on the given package"""
-    util.requires_package("grep-dctrl")
-    command = "apt-get indextargets --format '$(FILENAME)' "
-    command = command + "'Created-By: Sources' "
-    command = command + "| xargs grep-available -sPackage "
-    command = command + "-FBuild-Depends,Build-Depends-Indep "
-    command = command + args.package
-    perform.execute(command, teach=args.teach, noop=args.noop)
+    """Display the packages which build-depend on the given package
+
+    With --recursive also display the packages which build-depend on
+    the packages built by those, and so on."""
+    for source in sources.rbuilddeps(args.package, args.recursive):
+        print(source)
 
 
 def readme(args):
@@ -934,7 +1036,7 @@ def readme(args):
     postfixed with .gz.
     """
     matches = 'README README.Debian README.rst USAGE'
-    util.display_sys_docs(args.package, matches.split())
+    docs.show(args.package, matches.split())
 
 # REBOOT 20241206 gjw while this is also reported in SYSINFO a
 # separate command is handy to check why a reboot is required.
@@ -965,13 +1067,12 @@ def recdownload(args):
 
     package_names = list()
 
-    cache = apt.cache.Cache()
     for package in args.packages:
-        util.package_exists(cache, package)
+        util.find_package(package)
 
     print("Calculating all dependencies...")
     for package in args.packages:
-        package_names.extend(util.get_deps_recursively(cache, package, []))
+        package_names.extend(util.get_deps_recursively(package, []))
     print("Packages to download to /var/cache/apt/archives:")
     for package in package_names:
         # We do this because apt-get install dont list the packages to
@@ -991,12 +1092,14 @@ def reconfigure(args):
 
 
 def recommended(args):
-    """Display packages installed as Recommends and have no dependents"""
-    perform.execute(
-        "aptitude search "
-        "'?and( ?automatic(?reverse-recommends(?installed)), "
-        "?not(?automatic(?reverse-depends(?installed))) )'", teach=args.teach, noop=args.noop
-    )
+    """Display packages installed as Recommends and have no dependents
+
+    With --verbose also show the packages recommending each one."""
+    for package, recommenders in depgraph.recommended().items():
+        if args.verbose:
+            print("{:<{}} {}".format(package, util.CW, " ".join(recommenders)))
+        else:
+            print(package)
 
 
 def reinstall(args):
@@ -1007,12 +1110,10 @@ def reinstall(args):
 
 
 def reload(args):
-    """Reload system daemons (see LIST-DAEMONS for available daemons)"""
-    command = "/usr/sbin/service {} reload".format(args.daemon)
-    if perform.execute(command, root=True):
-        print("attempt FORCE-RELOAD instead")
-        command = "/usr/sbin/service {} force-reload ".format(args.daemon)
-        perform.execute(command, root=True, teach=args.teach, noop=args.noop)
+    """Reload system daemons (see LIST-DAEMONS for available daemons)
+
+    A daemon that fails to reload is force-reloaded instead."""
+    return services.command(args, "reload", fallback="force-reload")
 
 
 def remove(args):
@@ -1025,10 +1126,7 @@ def remove(args):
 
 def removeorphans(args):
     """Remove orphaned libraries"""
-    util.requires_package("deborphan")
-    packages = ""
-    for package in perform.execute("deborphan", pipe=True):
-        packages += " " + package.strip()
+    packages = " ".join(depgraph.orphans(args.sections))
     if packages:
         command = "/usr/bin/apt-get --auto-remove remove {} {}"
         command = command.format(args.yes, packages)
@@ -1059,8 +1157,7 @@ def repos(args):
 
 def restart(args):
     """Restart system daemons (see LIST-DAEMONS for available daemons)"""
-    command = "/usr/sbin/service {} restart".format(args.daemon)
-    perform.execute(command, root=True, teach=args.teach, noop=args.noop)
+    return services.command(args, "restart")
 
 
 # RMGROUP
@@ -1074,6 +1171,18 @@ def rmgroup(args):
     allows users to be removed from groups.
 
     $ wajig rmgroup fred sudo"""
+    members, _ = accounts.memberships()
+    if args.group not in members:
+        print(f"wajig rmgroup: error: no such group '{args.group}'")
+        return
+    if args.username not in members[args.group]:
+        print(f"User '{args.username}' is not a member of '{args.group}'.")
+        return
+    # deluser cannot remove a user from their primary group.
+    if accounts.primary_group(args.username) == args.group:
+        print(f"wajig rmgroup: error: '{args.group}' is the primary group "
+              f"of '{args.username}'")
+        return 1
     cmd = f'/usr/sbin/deluser {args.username} {args.group}'
     perform.execute(cmd, root=True, teach=args.teach, noop=args.noop)
 
@@ -1129,7 +1238,6 @@ def search(args):
         command = "apt --names-only search {}"
         command = command.format(" ".join(args.patterns))
     elif args.verbose == 1:
-        import shlex
         args.patterns = [shlex.quote(pattern) for pattern in args.patterns]
         command = "apt-cache search {} | grep -E --ignore-case '{}'"
         command = command.format(" ".join(args.patterns),
@@ -1158,15 +1266,13 @@ def show(args):
 
 def start(args):
     """Start system daemons (see LIST-DAEMONS for available daemons)"""
-    command = "/usr/sbin/service {} start".format(args.daemon)
-    perform.execute(command, root=True, teach=args.teach, noop=args.noop)
+    return services.command(args, "start")
 
 # STOP
 
 def stop(args):
     """Stop system daemons (see LISTDAEMONS for available daemons)"""
-    command = "/usr/sbin/service {} stop".format(args.daemon)
-    perform.execute(command, root=True, teach=args.teach, noop=args.noop)
+    return services.command(args, "stop")
 
 # SIZES
 
@@ -1203,146 +1309,24 @@ def status(args):
         if notregexp:
             pkgs.append(p)
         else:
-            try:
-                fnd = [s.strip() for s in
-                       util.do_listnames(p, pipe=True,
-                                         teach=args.teach, noop=args.noop).readlines()]
-                pkgs.extend(fnd)
-            except AttributeError:
-                pass
+            pkgs.extend(name.strip() for name in
+                        util.do_listnames(p, args.teach, args.noop))
     util.do_status(pkgs)
 
 # SYSINFO
 
 def sysinfo(args):
-    """Print information about your system"""
-
-    # HOSTNAME
-
-    command = "hostname"
-    result  = perform.execute(command, getoutput=True, teach=args.teach,
-                              noop=args.noop).decode("utf-8").strip()
-    print(f"Hostname:   {result}")
-
-    # OS
-
-    command = "cat /etc/*release | grep '^NAME=' | cut -d '\"' -f2"
-    result  = perform.execute(command, getoutput=True, teach=args.teach,
-                              noop=args.noop).decode("utf-8").strip()
-    command = "cat /etc/*release | grep '^VERSION=' | cut -d '\"' -f2"
-    ver     = perform.execute(command, getoutput=True, teach=args.teach,
-                              noop=args.noop).decode("utf-8").strip()
-    command = "uname -r"
-    kernel  = perform.execute(command, getoutput=True, teach=args.teach,
-                              noop=args.noop).decode("utf-8").strip()
-    print(f"OS:         {result} {ver} {kernel}")
-
-    # COMPUTER
-
-    file = "/var/log/kern.log"
-    if os.path.isfile(file) and os.access(file, os.R_OK):
-        command  = "/bin/zgrep DMI: /var/log/kern.log 2> /dev/null | /bin/grep kernel: | "
-        command += "/bin/uniq | /bin/sed 's|^.*DMI: ||' | /bin/head -1"
-        result  = perform.execute(command, getoutput=True, teach=args.teach,
-                                  noop=args.noop).decode("utf-8").strip()
-        print(f"Computer:   {result}")
-    else:
-        print(f"Computer:   <{file} not accessible>")
-
-    command = "cat /proc/cpuinfo | grep 'name'| uniq | sed 's|^model name	: ||'"
-    result  = perform.execute(command, getoutput=True, teach=args.teach,
-                              noop=args.noop).decode("utf-8").strip()
-    command = "cat /proc/cpuinfo | grep 'process'| wc -l"
-    count   = perform.execute(command, getoutput=True, teach=args.teach,
-                              noop=args.noop).decode("utf-8").strip()
-    command = "cat /proc/cpuinfo | grep bogomips | uniq | sed 's|bogomips\t:||'"
-    bogomip = perform.execute(command, getoutput=True, teach=args.teach,
-                              noop=args.noop).decode("utf-8").strip()
-    print(f"Processor:  {result} x {count} = {bogomip} bogomips")
-
-    lspci = perform.execute("lspci|head -1", getoutput=True)
-    if lspci:
-        command  =  'GPU=$(lspci | grep VGA | cut -d ":" -f3); '
-        command += 'RAM=$(cardid=$(lspci | grep VGA |cut -d " " -f1); '
-        command += 'lspci -v -s $cardid | grep " prefetchable"| '
-        command += r'cut -d "=" -f2 | tr -d "\]"); '
-        command += 'echo $GPU $RAM'
-        result  = perform.execute(command, getoutput=True, teach=args.teach,
-                                  noop=args.noop).decode("utf-8").strip()
-        print(f"Video:      {result}")
-
-        command =  'lspci | grep "Audio device:" | sed "s|^.*Audio device: ||"'
-        result  = perform.execute(command, getoutput=True, teach=args.teach,
-                              noop=args.noop).decode("utf-8").strip()
-        if result:
-            print(f"Audio:      {result}")
-        else:
-            print(f"Audio:      <lspci found no audio device>")
-    else:
-        print("Video:      <lspci produces no output>")
-        print("Audio:      <lspci produces no output>")
-
-    command = "cat /proc/meminfo | grep MemTotal | awk '{print $2/(1024*1024)}'"
-    result  = perform.execute(command, getoutput=True, teach=args.teach,
-                              noop=args.noop).decode("utf-8").strip()
-    print(f"Memory:     {round(float(result))}GB RAM")
-
-    # PRINTERS
-
-    # IN PROGRESS
-    # print("X")
-    # lpstat = perform.execute("lpstat -p | egrep '^printer' | cut -d' ' -f2", getoutput=True)
-    # if lpstat:
-    #     print("Printers:    {lpstat}")
-
-    # IP
-
-    localip = "<requires net-tools package>"
-    if shutil.which("/sbin/ifconfig"):
-        command = "/sbin/ifconfig | grep 'inet ' | awk '{print $2}'"
-        localip = perform.execute(command, getoutput=True, teach=args.teach,
-                                  noop=args.noop).decode("utf-8").strip().split("\n")
-        localip = ', '.join(localip)
-    command = "wget https://ipinfo.io/ip -qO -"
-    exterip = perform.execute(command, getoutput=True, teach=args.teach,
-                              noop=args.noop).decode("utf-8").strip()
-    print(f"IP:         {localip} (local) {exterip} (external)")
-
-    # UPTIME
-
-    command = "uptime --pretty"
-    up  = perform.execute(command, getoutput=True, teach=args.teach,
-                          noop=args.noop).decode("utf-8").strip()
-    command = "uptime --since"
-    since  = perform.execute(command, getoutput=True, teach=args.teach,
-                             noop=args.noop).decode("utf-8").strip()
-    print(f"Uptime:     {up} since {since}")
-
-    # LOAD
-
-    command = "uptime | perl -p -e 's|[^,]*, +||' | perl -p -e 's|  +| |g' | "
-    command += "cut -d' ' -f2-"
-    load  = perform.execute(command, getoutput=True, teach=args.teach,
-                            noop=args.noop).decode("utf-8").strip()
-    print(f"Load:       {load}")
-
-    # REBOOT
+    """Print information about your system
 
-    REBOOT = "/var/run/reboot-required"
-    PKGS = "/var/run/reboot-required.pkgs"
-    cmd = f"test -f {REBOOT}"
-    result = perform.execute(cmd)
-    reboot = "not required"
-    if result == 0:
-        reboot = "required"
-        cmd = f"test -f {PKGS}"
-        result = perform.execute(cmd)
-        if result == 0:
-            cmd = f"cat {PKGS} | sort -u"
-            pkgs = perform.execute(cmd, getoutput=True, teach=args.teach,
-                                   noop=args.noop).decode("utf-8").strip().split("\n")
-            reboot += " for " + ", ".join(pkgs) + " updates"
-    print(f"Reboot:     {reboot}")
+    The external IP address is looked up (with a short timeout) at
+    most once an hour. Use --offline to not look it up at all and
+    --json for output suitable for collecting from many hosts."""
+
+    info = system.collect(external=not args.offline)
+    if args.json:
+        print(json.dumps(info, indent=2))
+    else:
+        print("\n".join(system.report(info)))
 
 
 # TASKSEL
@@ -1356,7 +1340,7 @@ def tasksel(args):
 
 def todo(args):
     """Display the TODO file of a given package"""
-    util.display_sys_docs(args.package, ["TODO"])
+    docs.show(args.package, ["TODO"])
 
 
 def toupgrade(args):
@@ -1368,6 +1352,32 @@ def toupgrade(args):
     #    print("No upgradeable packages.")
 
 
+# TRIMCACHE
+
+def trimcache(args):
+    """Remove older versions of packages from the download cache
+
+    The newest versions of each package (two by default) are kept in
+    /var/cache/apt/archives/ and older versions are removed.
+
+    $ wajig trimcache --keep 1"""
+    if args.keep < 1:
+        print("wajig trimcache: error: at least one version must be kept.")
+        return 1
+    files = archives.surplus(args.keep)
+    if not files:
+        print("No older versions found in the download cache.")
+        return
+    size = sum(os.path.getsize(path) for path in files)
+    command = ["/bin/rm", "--force", "--"]
+    for batch in util.batches(files, " ".join(command)):
+        perform.run(command + batch, root=True,
+                    teach=args.teach, noop=args.noop)
+    if not args.noop:
+        print("Removed {} files {} from the cache.".format(
+            len(files), util.human_size(size)))
+
+
 def tutorial(args):
     """Display wajig tutorial"""
     perform.execute('zcat /usr/share/doc/wajig/TUTORIAL',
@@ -1376,14 +1386,10 @@ def tutorial(args):
 
 def unhold(args):
     """Remove listed packages from hold so they are again upgradeable"""
-    for package in args.packages:
-        # The dpkg needs sudo but not the echo.
-        # Do all of it as root then.
-        command = "echo \"" + package + " install\" | dpkg --set-selections"
-        perform.execute(command, root=True)
+    dpkgstatus.set_selections(args.packages, "install",
+                              teach=args.teach, noop=args.noop)
     print("The following packages are still on hold:")
-    perform.execute("dpkg --get-selections | grep -E 'hold$' | cut -f1",
-                    teach=args.teach, noop=args.noop)
+    print("\n".join(dpkgstatus.holds()))
 
 
 def unofficial(args):
@@ -1503,13 +1509,13 @@ def version(args):
 
 
 def versions(args):
-    """List version and distribution of given packages"""
-    util.requires_package("apt-show-versions")
-    if args.packages:
-        for package in args.packages:
-            perform.execute("apt-show-versions " + package, teach=args.teach, noop=args.noop)
-    else:
-        perform.execute("apt-show-versions", teach=args.teach, noop=args.noop)
+    """List version and distribution of given packages
+
+    Without packages list all installed packages. The installed and
+    candidate versions and the suite they come from are reported from a
+    single load of the package cache. Use --json to also include every
+    available version with its origins and pin priorities."""
+    versioninfo.show(args, lambda records: versioninfo.table_lines(records, util.CW))
 
 
 def whichpackage(args):
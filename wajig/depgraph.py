@@ -0,0 +1,164 @@
+# This file is part of wajig.  The copyright file is at debian/copyright.
+
+"""Dependency graph of the installed packages.
+
+The graph is built in one pass over the parsed dpkg status file, with
+each dependency resolved to the installed packages that satisfy it,
+directly or through Provides. Together with APT's record of which
+packages were automatically installed this answers questions such as
+which packages nothing needs any more (orphans) without deborphan."""
+
+import os
+
+import apt_pkg
+
+import wajig.util as util
+import wajig.status as status
+
+orphans_file = os.path.join(util.init_dir, "Orphans")
+
+# Sections that deborphan considers by default.
+
+LIBRARY_SECTIONS = ("libs", "oldlibs")
+
+
+def extended_states_file():
+    return apt_pkg.config.find_file("Dir::State::extended_states")
+
+
+def auto_installed():
+    """Return the names of the packages marked as automatically installed."""
+    names = set()
+    path = extended_states_file()
+    if os.path.exists(path):
+        with open(path) as f:
+            for section in apt_pkg.TagFile(f):
+                if section.get("Auto-Installed") == "1":
+                    names.add(section.get("Package"))
+    return names
+
+
+def generation():
+    """Identify the state the graph is built from."""
+    try:
+        extended = os.stat(extended_states_file()).st_mtime_ns
+    except OSError:
+        extended = 0
+    return [status.generation(), extended]
+
+
+def graph(types=("Pre-Depends", "Depends", "Recommends", "Suggests")):
+    """Return the installed packages and their dependencies.
+
+    Returns a dict mapping each installed package name to a dict that
+    maps each of the dependency TYPES to the set of installed packages
+    that satisfy those dependencies."""
+
+    installed = status.installed()
+    providers = {name: {name} for name in installed}
+    for name, record in installed.items():
+        for provided in apt_pkg.parse_depends(record.get("Provides", "")):
+            providers.setdefault(provided[0][0], set()).add(name)
+
+    edges = dict()
+    for name, record in installed.items():
+        edges[name] = dict()
+        for kind in types:
+            targets = set()
+            for group in apt_pkg.parse_depends(record.get(kind, "")):
+                for target, _, _ in group:
+                    targets.update(providers.get(target, ()))
+            targets.discard(name)
+            edges[name][kind] = targets
+    return edges
+
+
+def reverse(edges, kinds):
+    """Map each package to the packages that have a KINDS edge to it."""
+    result = {name: set() for name in edges}
+    for name, dependencies in edges.items():
+        for kind in kinds:
+            for target in dependencies.get(kind, ()):
+                result[target].add(name)
+    return result
+
+
+def recommended():
+    """Return the packages installed only because they are recommended.
+
+    These are automatically installed packages that some installed
+    package Recommends but that no installed package Depends on. The
+    result maps each such package to the sorted packages recommending
+    it."""
+
+    edges = graph(("Pre-Depends", "Depends", "Recommends"))
+    depended = reverse(edges, ("Pre-Depends", "Depends"))
+    recommenders = reverse(edges, ("Recommends",))
+    return {name: sorted(recommenders[name])
+            for name in sorted(auto_installed())
+            if recommenders.get(name) and not depended[name]}
+
+
+def section(record):
+    """The section of a package without any archive area prefix."""
+    return (record.get("Section") or "").rpartition("/")[2]
+
+
+def compute_orphans():
+    """Return the installed packages not needed by any root package.
+
+    The roots are the packages installed manually, the packages on
+    hold, the essential packages, and those of required or important
+    priority. Packages
+    reachable from a root through Depends (and, following APT's
+    AutoRemove settings, Recommends and Suggests) are needed."""
+
+    installed = status.installed()
+    auto = auto_installed()
+    config = apt_pkg.config
+    kinds = ["Pre-Depends", "Depends"]
+    if config.find_b("APT::AutoRemove::RecommendsImportant", True):
+        kinds.append("Recommends")
+    if config.find_b("APT::AutoRemove::SuggestsImportant", True):
+        kinds.append("Suggests")
+    edges = graph(kinds)
+
+    pending = [name for name, record in installed.items()
+               if name not in auto or record["want"] == "hold"
+               or record.get("Essential") == "yes"
+               or record.get("Priority") in ("required", "important")]
+    needed = set(pending)
+    while pending:
+        name = pending.pop()
+        for kind in kinds:
+            for target in edges[name][kind]:
+                if target not in needed:
+                    needed.add(target)
+                    pending.append(target)
+
+    return sorted(name for name in installed if name not in needed)
+
+
+def orphans(sections=None):
+    """Return the orphaned packages in SECTIONS.
+
+    SECTIONS defaults to the library sections and an empty list means
+    all sections.
+
+    The full list is kept in the wajig directory until the dpkg status
+    or the automatically installed flags change."""
+
+    key = generation()
+    cached = util.read_index(orphans_file)
+    if cached.get("key") == key and "orphans" in cached:
+        names = cached["orphans"]
+    else:
+        names = compute_orphans()
+        util.write_index(orphans_file, dict(key=key, orphans=names))
+    if sections is None:
+        sections = LIBRARY_SECTIONS
+    if not sections:
+        return names
+    installed = status.installed()
+    return [name for name in names
+            if name in installed and section(installed[name]) in sections]
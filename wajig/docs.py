@@ -0,0 +1,76 @@
+# This file is part of wajig.  The copyright file is at debian/copyright.
+
+"""Read the documentation installed under /usr/share/doc.
+
+Files are copied to standard output in chunks, decompressing those
+ending in .gz on the fly, so that the start of a large changelog
+reaches a pager (or head) straight away and nothing is written to a
+temporary file. A pager quitting early is not an error."""
+
+import os
+import sys
+import gzip
+
+import wajig.status as status
+
+DOC_DIR = "/usr/share/doc"
+
+CHUNK = 64 * 1024
+
+
+def find(package, filename):
+    """Return the path of the doc FILENAME of PACKAGE, or None.
+
+    The file may be installed as is or compressed with gzip."""
+
+    path = os.path.join(DOC_DIR, package.partition(":")[0], filename)
+    for candidate in (path, path + ".gz"):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def changelog(package):
+    """Return the path of the installed Debian changelog of PACKAGE."""
+    return find(package, "changelog.Debian") or find(package, "changelog")
+
+
+def stream(path, out=None):
+    """Copy the file PATH, decompressing .gz files, to OUT.
+
+    OUT defaults to the binary standard output. Returns False if the
+    reader went away (a closed pager) before the end of the file."""
+
+    opener = gzip.open if path.endswith(".gz") else open
+    try:
+        if out is None:
+            sys.stdout.flush()
+            out = sys.stdout.buffer
+        with opener(path, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK)
+                if not chunk:
+                    break
+                out.write(chunk)
+        out.flush()
+    except BrokenPipeError:
+        # Stop Python complaining again when it flushes stdout on exit.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return False
+    return True
+
+
+def show(package, filenames):
+    """Display each of FILENAMES found in the doc directory of PACKAGE."""
+    if package.partition(":")[0] not in status.installed():
+        print("'{}' is not installed".format(package))
+        return
+    paths = [(filename, find(package, filename)) for filename in filenames]
+    paths = [(filename, path) for filename, path in paths if path]
+    if not paths:
+        print("File not found")
+        return
+    for filename, path in paths:
+        print("{0:=^72}".format(" {0} ".format(filename)))
+        if not stream(path):
+            return
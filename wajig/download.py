@@ -0,0 +1,190 @@
+# This file is part of wajig.  The copyright file is at debian/copyright.
+
+"""Fetch .deb files from http, https, and ftp locations.
+
+Downloads are streamed to disk in chunks rather than read into memory,
+several locations are fetched at once, and an interrupted download is
+resumed from its partial file on the next attempt, provided the server
+confirms (through the ETag or Last-Modified recorded with the partial
+file) that the file has not changed since. A location may carry a
+checksum as a URL fragment, as in
+
+  https://example.com/c_1.0_all.deb#sha256=9f86d08...
+
+in which case the file is verified once downloaded, and a file already
+in the target directory that verifies is not downloaded again. Without
+a checksum an existing file is downloaded again, and replaced only once
+the new download is complete."""
+
+import os
+import hashlib
+import http.client
+import urllib.error
+import urllib.parse
+import urllib.request
+import concurrent.futures
+
+import wajig.util as util
+
+SCHEMES = ("https://", "http://", "ftp://")
+
+# CHUNK is the number of bytes read from the network and written to
+# disk at a time. WORKERS bounds the number of concurrent downloads and
+# TIMEOUT (seconds) bounds each blocking network operation.
+
+CHUNK = 1024 * 1024
+WORKERS = 4
+TIMEOUT = 60
+
+
+class ChecksumError(Exception):
+    """A downloaded file does not match its expected checksum."""
+
+
+class DuplicateError(Exception):
+    """A location has the same file name as another being fetched."""
+
+
+def is_url(name):
+    return name.startswith(SCHEMES)
+
+
+def split_url(url):
+    """Return the location, file name, and (algorithm, digest) of URL.
+
+    The checksum is taken from a fragment of the form ALGORITHM=DIGEST
+    and is None if the URL has no such fragment."""
+
+    location, fragment = urllib.parse.urldefrag(url)
+    filename = os.path.basename(urllib.parse.urlparse(location).path)
+    checksum = None
+    if "=" in fragment:
+        algorithm, digest = fragment.split("=", 1)
+        if algorithm.lower() in hashlib.algorithms_available:
+            checksum = (algorithm.lower(), digest.lower())
+    return location, filename, checksum
+
+
+def verified(path, checksum):
+    return os.path.exists(path) and \
+        util.file_digest(path, checksum[0]) == checksum[1]
+
+
+def _validator(path):
+    """The ETag or Last-Modified recorded for the partial file PATH."""
+    try:
+        with open(path + ".validator") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _discard(partial):
+    for path in (partial, partial + ".validator"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _stream(location, partial):
+    """Append the remainder of LOCATION to the file PARTIAL.
+
+    The partial file is resumed only if it has a recorded validator,
+    which is sent as If-Range so that a server whose copy has changed
+    sends the whole file instead of the remainder."""
+
+    validator = _validator(partial)
+    if not validator or location.startswith("ftp://"):
+        _discard(partial)
+        validator = None
+    offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+    request = urllib.request.Request(location)
+    if offset:
+        request.add_header("Range", "bytes={}-".format(offset))
+        request.add_header("If-Range", validator)
+    try:
+        response = urllib.request.urlopen(request, timeout=TIMEOUT)
+    except urllib.error.HTTPError as error:
+        # 416 means there is nothing beyond OFFSET. If the server
+        # agrees on the total size then the partial file is complete,
+        # otherwise start over.
+        if error.code != 416 or not offset:
+            raise
+        total = error.headers.get("Content-Range", "").rpartition("/")[2]
+        if total == str(offset):
+            return
+        _discard(partial)
+        return _stream(location, partial)
+    with response:
+        resumed = offset and getattr(response, "status", 200) == 206
+        headers = response.headers
+        validator = headers.get("ETag") or headers.get("Last-Modified")
+        if not resumed:
+            _discard(partial)
+            # A weak ETag cannot be used with If-Range.
+            if validator and not validator.startswith("W/"):
+                with open(partial + ".validator", "w") as f:
+                    f.write(validator)
+        with open(partial, "ab" if resumed else "wb") as f:
+            for chunk in iter(lambda: response.read(CHUNK), b""):
+                f.write(chunk)
+
+
+def fetch(url, directory):
+    """Download URL into DIRECTORY and return the path of the file.
+
+    Returns without touching the network if a verified copy is already
+    present. Raises ChecksumError if the downloaded file does not
+    match the checksum given in the URL. An existing file is left in
+    place if the download fails."""
+
+    location, filename, checksum = split_url(url)
+    target = os.path.join(directory, filename)
+    partial = target + ".part"
+
+    if checksum and verified(target, checksum):
+        return target
+
+    _stream(location, partial)
+
+    if checksum and not verified(partial, checksum):
+        _discard(partial)
+        raise ChecksumError("{} checksum mismatch".format(checksum[0]))
+    os.replace(partial, target)
+    _discard(partial)
+    return target
+
+
+def fetch_all(urls, directory, workers=WORKERS):
+    """Download URLS concurrently into DIRECTORY.
+
+    Returns a list of the downloaded paths, in the order of URLS, and
+    a list of (url, error) pairs for the locations that failed."""
+
+    os.makedirs(directory, exist_ok=True)
+    paths = dict()
+    failed = list()
+    # Locations with the same file name would share the same partial
+    # and target files, so only the first of them is fetched.
+    first = dict()
+    for url in dict.fromkeys(urls):
+        filename = split_url(url)[1]
+        if filename in first:
+            failed.append((url, DuplicateError(
+                "{} is already fetched from '{}'".format(
+                    filename, first[filename]))))
+        else:
+            first[filename] = url
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch, url, directory): url
+                   for url in first.values()}
+        for future in concurrent.futures.as_completed(futures):
+            url = futures[future]
+            try:
+                paths[url] = future.result()
+            # ValueError and HTTPException cover malformed locations
+            # and responses, such as a URL with a space or a body cut
+            # short.
+            except (urllib.error.URLError, OSError, ChecksumError,
+                    http.client.HTTPException, ValueError) as error:
+                failed.append((url, error))
+    return [paths[url] for url in urls if url in paths], failed
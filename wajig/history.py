@@ -0,0 +1,188 @@
+# This file is part of wajig.  The copyright file is at debian/copyright.
+
+"""Index of the transactions recorded in APT's history log.
+
+The current history.log and its rotated (gzip compressed) copies are
+parsed into transactions, each with its start and end date, command
+line, requesting user, and the packages acted upon. The transactions
+are kept in the wajig directory against the inode of the file they
+came from. The current log is read on from where the last run stopped
+and a rotated log, which never changes, is read only once."""
+
+import os
+import re
+import gzip
+
+import apt_pkg
+
+import wajig.util as util
+
+index_file = os.path.join(util.init_dir, "AptHistory")
+
+# The actions a transaction may record against its packages.
+
+ACTIONS = ("Install", "Reinstall", "Upgrade", "Downgrade", "Remove", "Purge")
+
+# A package with its version(s) and flags: foo:amd64 (1.0, automatic)
+
+ENTRY = re.compile(r"([^\s,()]+) \(([^)]*)\)")
+
+
+def history_file():
+    return apt_pkg.config.find_file("Dir::Log::History")
+
+
+def log_files():
+    """Return the current and rotated history logs, oldest first."""
+    current = history_file()
+    directory, name = os.path.split(current)
+    rotated = list()
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                match = re.fullmatch(re.escape(name) + r"\.(\d+)(\.gz)?",
+                                     entry.name)
+                if match and entry.is_file():
+                    rotated.append((int(match.group(1)), entry.path))
+    except OSError:
+        return []
+    paths = [path for _, path in sorted(rotated, reverse=True)]
+    if os.path.isfile(current):
+        paths.append(current)
+    return paths
+
+
+def normalise_date(text):
+    # apt separates the date and time with two spaces.
+    return " ".join(text.split())
+
+
+def parse(f):
+    """Parse the transactions from the binary file object F.
+
+    Yields each complete transaction with the offset in F just after
+    it. A transaction still being written is not yielded."""
+
+    offset = f.tell()
+    transaction = None
+    for raw in f:
+        offset += len(raw)
+        line = raw.decode("utf-8", "replace").rstrip("\n")
+        field, _, value = line.partition(": ")
+        if field == "Start-Date":
+            transaction = dict(start=normalise_date(value), end=None,
+                               commandline=None, user="root", actions={})
+        elif transaction is None:
+            continue
+        elif field == "Commandline":
+            transaction["commandline"] = value
+        elif field == "Requested-By":
+            transaction["user"] = value.split()[0]
+        elif field in ACTIONS:
+            transaction["actions"][field] = ENTRY.findall(value)
+        elif field == "Error":
+            transaction["error"] = value
+        elif field == "End-Date":
+            transaction["end"] = normalise_date(value)
+            yield transaction, offset
+            transaction = None
+
+
+def read(path, offset=0):
+    """Return the transactions in PATH after OFFSET and the new offset."""
+    transactions = list()
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        f.seek(offset)
+        for transaction, end in parse(f):
+            transactions.append(transaction)
+            offset = end
+    return transactions, offset
+
+
+def load():
+    """Return all the transactions in the history logs, oldest first.
+
+    Each file's transactions are kept against its inode so that
+    rotation (which renames the files) does not cause them to be read
+    again, and only what has been appended to the current log since
+    the last run is read."""
+
+    index = util.read_index(index_file)
+
+    files = dict()
+    changed = False
+    for path in log_files():
+        try:
+            stat = os.stat(path)
+            inode = str(stat.st_ino)
+            known = index.get(inode)
+            if known and known["size"] == stat.st_size and \
+               known["compressed"] == path.endswith(".gz"):
+                files[inode] = known
+                continue
+            if known and not path.endswith(".gz") and \
+               not known["compressed"] and stat.st_size >= known["size"]:
+                # The current log has been appended to.
+                transactions, offset = read(path, known["offset"])
+                transactions = known["transactions"] + transactions
+            else:
+                transactions, offset = read(path)
+        except (OSError, EOFError, gzip.BadGzipFile):
+            continue
+        files[inode] = dict(path=path, size=stat.st_size, offset=offset,
+                            compressed=path.endswith(".gz"),
+                            transactions=transactions)
+        changed = True
+
+    if changed or files.keys() != index.keys():
+        util.write_index(index_file, files)
+
+    transactions = [t for entry in files.values()
+                    for t in entry["transactions"]]
+    return sorted(transactions, key=lambda t: t["start"])
+
+
+def matches(name, package):
+    """Whether the logged NAME (which has an :arch) is PACKAGE."""
+    return name == package or name.partition(":")[0] == package
+
+
+def search(package=None, since=None, user=None):
+    """Return the transactions involving PACKAGE, since SINCE, by USER.
+
+    SINCE is a date (and time) as YYYY-MM-DD [HH:MM:SS]. When PACKAGE
+    is given only its entries are kept in the actions of each
+    transaction."""
+
+    found = list()
+    for transaction in load():
+        if since and transaction["start"] < since:
+            continue
+        if user and transaction["user"] != user:
+            continue
+        if package:
+            actions = dict()
+            for action, entries in transaction["actions"].items():
+                entries = [e for e in entries if matches(e[0], package)]
+                if entries:
+                    actions[action] = entries
+            if not actions:
+                continue
+            transaction = dict(transaction, actions=actions)
+        found.append(transaction)
+    return found
+
+
+def report(transactions):
+    """Lines describing TRANSACTIONS in the style of the history log."""
+    lines = list()
+    for t in transactions:
+        lines.append("{}  {:<10} {}".format(t["start"], t["user"],
+                                            t["commandline"] or ""))
+        for action, entries in t["actions"].items():
+            lines.append("    {}: {}".format(action, ", ".join(
+                "{} ({})".format(name, details) for name, details in entries)))
+        if t.get("error"):
+            lines.append("    Error: " + t["error"])
+    return lines
@@ -0,0 +1,116 @@
+# This file is part of wajig.  The copyright file is at debian/copyright.
+
+"""Available package versions from the APT Packages lists.
+
+Each Packages index under /var/lib/apt/lists is parsed into a map of
+package names to versions and kept in the wajig directory with the
+size, modification time, and hash of the file. After an update only
+the indexes whose content has changed (often just the one for the
+security archive) are parsed again.
+
+The version available for a package is the newest in the archives
+APT installs from by default, falling back to those marked
+NotAutomatic (such as experimental and backports) only for packages
+found nowhere else. Pins in the APT preferences are not taken into
+account."""
+
+import os
+
+import apt_pkg
+
+import wajig.util as util
+
+index_file = os.path.join(util.init_dir, "Lists")
+
+
+def packages_files():
+    """Return the Packages index files in the APT lists directory."""
+    return util.list_files("Packages")
+
+
+def not_automatic():
+    """Return the path prefixes of the lists from NotAutomatic archives.
+
+    The Packages files of an archive share the prefix of its InRelease
+    (or Release) file."""
+
+    directory = util.lists_dir()
+    prefixes = list()
+    if not os.path.isdir(directory):
+        return prefixes
+    for entry in os.scandir(directory):
+        for suffix in ("_InRelease", "_Release"):
+            if entry.name.endswith(suffix):
+                try:
+                    with open(entry.path, errors="replace") as f:
+                        if any(line.strip() == "NotAutomatic: yes"
+                               for line in f):
+                            prefixes.append(entry.path[:-len(suffix)] + "_")
+                except OSError:
+                    pass
+    return prefixes
+
+
+def parse(path):
+    """Return a dict mapping the packages in PATH to their newest version."""
+    versions = dict()
+    for section in apt_pkg.TagFile(path):
+        name, version = section.get("Package"), section.get("Version")
+        if not name or not version:
+            continue
+        if name not in versions or \
+           apt_pkg.version_compare(version, versions[name]) > 0:
+            versions[name] = version
+    return versions
+
+
+def load():
+    """Return the versions in each Packages file, parsing changed files.
+
+    Returns a dict mapping each Packages file to a dict of its package
+    versions. A file is parsed again only when its size or modification
+    time have changed and its hash shows its content has too."""
+
+    index = util.read_index(index_file)
+
+    files = dict()
+    changed = False
+    for path in packages_files():
+        known = index.get(path)
+        try:
+            stat = os.stat(path)
+            if known and known["size"] == stat.st_size and \
+               known["mtime"] == stat.st_mtime_ns:
+                files[path] = known
+                continue
+            digest = util.file_digest(path)
+            if known and known["hash"] == digest:
+                versions = known["versions"]
+            else:
+                versions = parse(path)
+        except (OSError, SystemError):
+            continue
+        files[path] = dict(size=stat.st_size, mtime=stat.st_mtime_ns,
+                           hash=digest, versions=versions)
+        changed = True
+
+    if changed or files.keys() != index.keys():
+        util.write_index(index_file, files)
+    return {path: entry["versions"] for path, entry in files.items()}
+
+
+def available():
+    """Return a dict mapping available package names to their versions."""
+    demoted = tuple(not_automatic())
+    versions = dict()
+    fallback = dict()
+    for path, packages in load().items():
+        target = fallback if demoted and path.startswith(demoted) \
+            else versions
+        for name, version in packages.items():
+            if name not in target or \
+               apt_pkg.version_compare(version, target[name]) > 0:
+                target[name] = version
+    for name, version in fallback.items():
+        versions.setdefault(name, version)
+    return versions
@@ -1,6 +1,9 @@
 # This file is part of wajig.  The copyright file is at debian/copyright.
 
 import os
+import time
+import shlex
+import tempfile
 import subprocess
 
 
@@ -22,6 +25,197 @@ else:
     setroot = "/bin/su"
 
 
+def authenticate():
+    """Have sudo credentials cached before running commands as root.
+
+    This avoids several password prompts when a number of commands are
+    to run together. A password is only asked for if sudo requires one."""
+
+    if setroot == "/usr/bin/sudo":
+        dt = " -n date >/dev/null 2>&1"
+        if (subprocess.call(setroot + dt, shell=True) and
+            subprocess.call(setroot + " -v", shell=True)):
+            raise SystemExit("sudo authentication failed.")
+
+
+# The commands run, each with its exit status, the wall clock time
+# it took, the user and system CPU time it (and any processes it waited
+# for) used, and its peak resident set size in KiB (which Linux carries
+# over from wajig at the fork). See report().
+
+timings = list()
+
+
+def prompts():
+    """Whether each command run as root asks for the root password.
+
+    This is so under su, which also reads the password from the
+    standard input, rather than sudo."""
+    return setroot != "/usr/bin/sudo" and os.getuid() != 0
+
+
+def as_root(argv):
+    """The argument vector to run ARGV as root."""
+    if setroot == "/usr/bin/sudo":
+        return [setroot] + argv
+    if os.getuid():
+        return [setroot, "-c", shlex.join(argv)]
+    return argv
+
+
+def describe(pipeline):
+    return " | ".join(shlex.join(argv) for argv in pipeline)
+
+
+def wait(process, command, started):
+    """Wait for PROCESS and record its resource usage in timings."""
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    timings.append(dict(command=command, status=process.returncode,
+                        wall=time.monotonic() - started,
+                        user=usage.ru_utime, system=usage.ru_stime,
+                        rss=usage.ru_maxrss))
+    return process.returncode
+
+
+def start(pipeline, root=False, cwd=None, stdin=None, stdout=None,
+          stderr=None):
+    """Start the PIPELINE of argument vectors, each reading the last.
+
+    STDIN is given to the first command and STDOUT and STDERR to the
+    last. Returns the processes."""
+
+    processes = list()
+    for position, argv in enumerate(pipeline):
+        last = position == len(pipeline) - 1
+        process = subprocess.Popen(
+            as_root(list(argv)) if root else list(argv), cwd=cwd,
+            stdin=processes[-1].stdout if processes else stdin,
+            stdout=stdout if last else subprocess.PIPE,
+            stderr=stderr if last else None,
+        )
+        if processes:
+            # Only the next command reads the output, so that the
+            # previous one sees a broken pipe if it exits early.
+            processes[-1].stdout.close()
+        processes.append(process)
+    return processes
+
+
+def finish(processes, pipeline, started):
+    """Wait for PROCESSES and return the exit status of the last."""
+    statuses = [wait(process, describe([argv]), started)
+                for process, argv in zip(processes, pipeline)]
+    return statuses[-1]
+
+
+def run(*pipeline, root=False, input=None, cwd=None, teach=False,
+        noop=False):
+    """Run the PIPELINE of argument vectors without a shell.
+
+    Each argument vector is a list of the program and its arguments,
+    so no quoting is needed. INPUT is a string sent to the standard
+    input of the first command. Returns the exit status of the last."""
+
+    if noop or teach:
+        print(highlight(describe(pipeline)))
+        if noop:
+            return
+    if root and len(pipeline) > 1:
+        authenticate()
+    if input is not None and root and prompts():
+        # su reads the password from the standard input, so the input
+        # is passed in a file the root side redirects from instead.
+        with tempfile.NamedTemporaryFile("w", prefix="wajig_",
+                                         delete=False) as f:
+            f.write(input)
+        try:
+            first = ["/bin/sh", "-c", shlex.join(pipeline[0]) + " < " +
+                     shlex.quote(f.name)]
+            started = time.monotonic()
+            processes = start((first,) + pipeline[1:], root, cwd)
+            return finish(processes, pipeline, started)
+        finally:
+            os.remove(f.name)
+    started = time.monotonic()
+    processes = start(pipeline, root, cwd,
+                      stdin=subprocess.PIPE if input is not None else None)
+    if input is not None:
+        try:
+            processes[0].stdin.write(input.encode())
+        except BrokenPipeError:
+            pass
+        processes[0].stdin.close()
+    return finish(processes, pipeline, started)
+
+
+def stream(*pipeline, root=False, cwd=None, merge=False, teach=False,
+           noop=False):
+    """Yield the lines output by the PIPELINE of argument vectors.
+
+    The lines are yielded as the last command writes them. With MERGE
+    its error output is included. The commands are waited for once
+    the output ends or the generator is closed."""
+
+    if noop or teach:
+        print(highlight(describe(pipeline)))
+        if noop:
+            return
+    if root and len(pipeline) > 1:
+        authenticate()
+    started = time.monotonic()
+    processes = start(pipeline, root, cwd, stdout=subprocess.PIPE,
+                      stderr=subprocess.STDOUT if merge else None)
+    try:
+        for line in processes[-1].stdout:
+            yield line.decode(errors="replace")
+    finally:
+        processes[-1].stdout.close()
+        finish(processes, pipeline, started)
+
+
+def capture(*pipeline, root=False, cwd=None, merge=False, teach=False,
+            noop=False):
+    """Return the exit status and output of the PIPELINE."""
+    if noop or teach:
+        print(highlight(describe(pipeline)))
+        if noop:
+            return 0, ""
+    if root and len(pipeline) > 1:
+        authenticate()
+    started = time.monotonic()
+    processes = start(pipeline, root, cwd, stdout=subprocess.PIPE,
+                      stderr=subprocess.STDOUT if merge else None)
+    with processes[-1].stdout as f:
+        output = f.read().decode(errors="replace")
+    return finish(processes, pipeline, started), output
+
+
+def report(wall=None):
+    """Lines breaking down the time taken by the commands run.
+
+    WALL is the time wajig took altogether, which with its own CPU time
+    is given in a final line."""
+
+    lines = ["{:>8} {:>8} {:>8} {:>9}  {}".format(
+        "Wall", "User", "System", "Max RSS", "Command")]
+    for t in timings:
+        lines.append("{:>7.2f}s {:>7.2f}s {:>7.2f}s {:>7}Ki  {}{}".format(
+            t["wall"], t["user"], t["system"], t["rss"], t["command"],
+            "" if not t["status"] else "  (exit status {})".format(
+                t["status"])))
+    if timings:
+        lines.append("{:>7.2f}s {:>7.2f}s {:>7.2f}s {:>9}  {} commands".format(
+            sum(t["wall"] for t in timings), sum(t["user"] for t in timings),
+            sum(t["system"] for t in timings), "",
+            len(timings)))
+    if wall is not None:
+        own = os.times()
+        lines.append("{:>7.2f}s {:>7.2f}s {:>7.2f}s {:>9}  wajig".format(
+            wall, own.user, own.system, ""))
+    return lines
+
+
 def execute(command, root=False, pipe=False, langC=False,
             getoutput=False, log=False, teach=False, noop=False):
     """Ask the operating system to perform a command.
@@ -54,10 +248,7 @@ def execute(command, root=False, pipe=False, langC=False,
             # so proceed to ask for it.
             #
             if ('|' in command):
-                dt = " -n date >/dev/null 2>&1"
-                if (subprocess.call(setroot + dt, shell=True) and
-                    subprocess.call(setroot + " -v", shell=True)):
-                    raise SystemExit("sudo authentication failed.")
+                authenticate()
             #
             # Bug #320126 noted the following is not good as is since
             # the password is asked for multiple times in a pipe
@@ -93,16 +284,25 @@ def execute(command, root=False, pipe=False, langC=False,
     if pipe:
         return os.popen(command)
     if getoutput:
-        return subprocess.check_output(command, shell=True,
-                                       stderr=subprocess.STDOUT)
+        started = time.monotonic()
+        process = subprocess.Popen(command, shell=True,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
+        with process.stdout as f:
+            output = f.read()
+        if wait(process, " ".join(command.split()), started):
+            raise subprocess.CalledProcessError(process.returncode,
+                                                command, output)
+        return output
     if log:
-        import tempfile
         import wajig.util as util
         temp = tempfile.mkstemp(dir='/tmp', prefix='wajig_')[1]
         util.start_log(temp)
     # print("PERFORM TEACH = " + str(teach))
     # print("PERFORM COMMAND = " + str(command))
-    result = subprocess.call(command, shell=True)
+    started = time.monotonic()
+    process = subprocess.Popen(command, shell=True)
+    result = wait(process, " ".join(command.split()), started)
     if log:
         util.finish_log(temp)
     return result
@@ -0,0 +1,207 @@
+# This file is part of wajig.  The copyright file is at debian/copyright.
+
+"""The system services (daemons) and their control.
+
+Services are found in-process from the systemd unit directories and
+/etc/init.d, together with whether each is enabled, without chkconfig.
+The list is kept in the wajig directory until one of those directories
+(or the directories recording which services are enabled) changes.
+
+Services are started, stopped, restarted, or reloaded several at once,
+each bounded by a timeout, with the output of each shown in turn."""
+
+import os
+import concurrent.futures
+
+import wajig.util as util
+import wajig.perform as perform
+
+# In order of precedence, as for systemd.
+
+UNIT_DIRS = ("/etc/systemd/system", "/run/systemd/system",
+             "/lib/systemd/system", "/usr/lib/systemd/system")
+
+INIT_DIR = "/etc/init.d"
+
+# Scripts in /etc/init.d that are not services.
+
+NOT_SERVICES = ("README", "skeleton", "rc", "rcS", "functions")
+
+# WORKERS bounds the number of services controlled at once and
+# TIMEOUT (seconds) the time each is given.
+
+WORKERS = 4
+TIMEOUT = 90
+
+TIMED_OUT = 124  # The exit status of timeout(1) when the time is up.
+
+index_file = os.path.join(util.init_dir, "Services")
+
+
+def state_dirs():
+    """The directories whose changes may change the services found."""
+    directories = [INIT_DIR] + list(UNIT_DIRS)
+    directories.extend("/etc/rc{}.d".format(level) for level in "2345S")
+    for directory in UNIT_DIRS[:2]:
+        if os.path.isdir(directory):
+            directories.extend(entry.path for entry in os.scandir(directory)
+                               if entry.name.endswith(".wants")
+                               and entry.is_dir())
+    return sorted(directories)
+
+
+def key():
+    result = list()
+    for directory in state_dirs():
+        try:
+            result.append([directory, os.stat(directory).st_mtime_ns])
+        except OSError:
+            pass
+    return result
+
+
+def wanted():
+    """Return the names of the units enabled through a .wants directory."""
+    names = set()
+    for directory in UNIT_DIRS[:2]:
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".wants") and entry.is_dir():
+                names.update(os.listdir(entry.path))
+    return names
+
+
+def started():
+    """Return the names of the init.d scripts started at some runlevel."""
+    names = set()
+    for level in "2345S":
+        directory = "/etc/rc{}.d".format(level)
+        if os.path.isdir(directory):
+            names.update(name[3:] for name in os.listdir(directory)
+                         if name.startswith("S"))
+    return names
+
+
+def discover():
+    """Return a dict mapping service names to their details.
+
+    The details are the kind (systemd or sysv), the path of the unit
+    or script, and the state (enabled, disabled, or masked)."""
+
+    services = dict()
+    enabled = wanted()
+    for directory in UNIT_DIRS:
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            name, _, suffix = entry.name.rpartition(".")
+            # Templates (name@.service) need an instance to be controlled.
+            if suffix != "service" or name.endswith("@") or \
+               name in services:
+                continue
+            target = os.path.realpath(entry.path)
+            if target == os.devnull:
+                state = "masked"
+            elif os.path.basename(target) != entry.name:
+                continue  # An alias of another unit.
+            elif entry.name in enabled:
+                state = "enabled"
+            else:
+                state = "disabled"
+            services[name] = dict(kind="systemd", path=entry.path,
+                                  state=state)
+    runlevels = started()
+    if os.path.isdir(INIT_DIR):
+        for entry in os.scandir(INIT_DIR):
+            if entry.name in services or entry.name in NOT_SERVICES or \
+               entry.name.startswith(".") or not entry.is_file():
+                continue
+            state = "enabled" if entry.name in runlevels else "disabled"
+            services[entry.name] = dict(kind="sysv", path=entry.path,
+                                        state=state)
+    return services
+
+
+def load():
+    """Return the services, rediscovering them if anything changed."""
+    mtimes = key()
+    index = util.read_index(index_file)
+    if index.get("key") == mtimes and "services" in index:
+        return index["services"]
+    services = discover()
+    util.write_index(index_file, dict(key=mtimes, services=services))
+    return services
+
+
+def run(name, action, timeout, teach=False, noop=False):
+    """Run ACTION on the service NAME; return its status and output."""
+    command = ["/usr/bin/timeout", str(timeout), "/usr/sbin/service",
+               name, action]
+    return perform.capture(command, root=True, merge=True,
+                           teach=teach, noop=noop)
+
+
+def control(action, names, fallback=None, workers=WORKERS, timeout=TIMEOUT,
+            teach=False, noop=False):
+    """Run ACTION on each of the services NAMES, several at once.
+
+    If ACTION fails for a service and FALLBACK is given that action is
+    tried instead. Returns a list of the name, status (0 for success),
+    and output of each service, in the order of NAMES."""
+
+    if not noop:
+        perform.authenticate()
+        # Without sudo each service would prompt for the root password,
+        # and several prompts cannot share the terminal.
+        if perform.prompts():
+            workers = 1
+
+    def one(name):
+        status, output = run(name, action, timeout, teach, noop)
+        if status and status != TIMED_OUT and fallback:
+            status, more = run(name, fallback, timeout, teach, noop)
+            output += more
+        return name, status, output
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(one, names))
+
+
+def summary(action, results):
+    """Lines of the output and result of each service, then a count."""
+    lines = list()
+    failed = 0
+    for name, status, output in results:
+        if output.strip():
+            lines.append(output.rstrip("\n"))
+        if status == TIMED_OUT:
+            result = "timed out"
+        elif status:
+            result = "failed (exit status {})".format(status)
+        else:
+            result = "ok"
+        failed += bool(status)
+        lines.append("{} {}: {}".format(action, name, result))
+    if len(results) > 1:
+        lines.append("{} of {} services failed.".format(failed, len(results)))
+    return lines
+
+
+def command(args, action, fallback=None):
+    """Run ACTION on the daemons of a command line, several at once.
+
+    Each daemon is given --timeout seconds. The output of each is shown
+    in turn followed by whether it succeeded. Returns the exit status
+    for wajig: 1 if any daemon is unknown or failed."""
+
+    names = list(dict.fromkeys(args.daemon))
+    known = load()
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        print(f"wajig {action}: error: no such daemon: " + " ".join(unknown))
+        return 1
+    results = control(action, names, fallback, timeout=args.timeout,
+                      teach=args.teach, noop=args.noop)
+    print("\n".join(summary(action, results)))
+    return int(any(status for _, status, _ in results))
@@ -0,0 +1,86 @@
+# This file is part of wajig.  The copyright file is at debian/copyright.
+
+"""Reverse build-dependency index over the APT Sources lists.
+
+The Sources indexes under /var/lib/apt/lists (compressed or not) are
+parsed once into a map from each binary package to the source packages
+that build-depend on it, and from each source package to the binary
+packages it builds. The index is kept in the wajig directory and is
+rebuilt only when the set of Sources files, their sizes, or their
+modification times change."""
+
+import os
+
+import apt_pkg
+
+import wajig.util as util
+
+index_file = os.path.join(util.init_dir, "BuildDepends")
+
+FIELDS = ("Build-Depends", "Build-Depends-Indep", "Build-Depends-Arch")
+
+
+def sources_files():
+    """Return the Sources index files in the APT lists directory."""
+    return util.list_files("Sources")
+
+
+def fingerprint(paths):
+    result = list()
+    for path in paths:
+        stat = os.stat(path)
+        result.append([path, stat.st_size, stat.st_mtime_ns])
+    return result
+
+
+def build():
+    """Parse the Sources files into the reverse build-dependency maps."""
+    rdepends = dict()
+    binaries = dict()
+    for path in sources_files():
+        for section in apt_pkg.TagFile(path):
+            source = section.get("Package")
+            if not source:
+                continue
+            binaries.setdefault(source, set()).update(
+                name.strip() for name in section.get("Binary", "").split(",")
+                if name.strip())
+            for field in FIELDS:
+                for group in apt_pkg.parse_src_depends(section.get(field, "")):
+                    for name, _, _ in group:
+                        rdepends.setdefault(name.split(":")[0], set())\
+                            .add(source)
+    return ({name: sorted(sources) for name, sources in rdepends.items()},
+            {name: sorted(names) for name, names in binaries.items()})
+
+
+def load():
+    """Return the (rdepends, binaries) maps, rebuilding them if stale."""
+    key = fingerprint(sources_files())
+    index = util.read_index(index_file)
+    if index.get("key") == key and "rdepends" in index:
+        return index["rdepends"], index["binaries"]
+    rdepends, binaries = build()
+    util.write_index(index_file, dict(key=key, rdepends=rdepends,
+                                      binaries=binaries))
+    return rdepends, binaries
+
+
+def rbuilddeps(package, recursive=False):
+    """Return the source packages that build-depend on PACKAGE.
+
+    With RECURSIVE also include those that build-depend on any binary
+    package built by such a source package, and so on."""
+
+    rdepends, binaries = load()
+    found = set(rdepends.get(package, ()))
+    if not recursive:
+        return sorted(found)
+    pending = list(found)
+    while pending:
+        for binary in binaries.get(pending.pop(), ()):
+            for source in rdepends.get(binary, ()):
+                if source not in found:
+                    found.add(source)
+                    pending.append(source)
+    return sorted(found)
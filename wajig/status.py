@@ -0,0 +1,92 @@
+# This file is part of wajig.  The copyright file is at debian/copyright.
+
+"""Parsed view of the dpkg status file.
+
+The status file is parsed once per process and again only if it has
+changed since (by modification time), so commands can consult it
+freely rather than running dpkg-query pipelines."""
+
+import os
+
+import apt_pkg
+
+import wajig.perform as perform
+import wajig.trace as trace
+
+# The fields retained from each stanza of the status file.
+
+FIELDS = (
+    "Package", "Architecture", "Version", "Status", "Section",
+    "Priority", "Essential", "Installed-Size", "Source", "Provides",
+    "Pre-Depends", "Depends", "Recommends", "Suggests",
+)
+
+_loaded = dict()
+
+
+def status_file():
+    return apt_pkg.config.find_file("Dir::State::status")
+
+
+def generation():
+    """Identify the current state of the status file."""
+    try:
+        return os.stat(status_file()).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def load():
+    """Return a list of records, one per stanza of the status file.
+
+    Each record is a dict of the FIELDS present in the stanza together
+    with 'want', 'flag', and 'state' split out of the Status field."""
+
+    path = status_file()
+    current = generation()
+    if _loaded.get(path, (None,))[0] == current:
+        return _loaded[path][1]
+    records = list()
+    if current:
+        with trace.span("status parse"), open(path) as f:
+            for section in apt_pkg.TagFile(f):
+                record = {field: section.get(field) for field in FIELDS
+                          if field in section}
+                want, flag, state = (section.get("Status", "") + "  ")\
+                    .split(" ")[:3]
+                record.update(want=want, flag=flag, state=state)
+                records.append(record)
+        trace.count("status records", len(records))
+    _loaded[path] = (current, records)
+    return records
+
+
+def installed():
+    """Return a dict mapping names of installed packages to records."""
+    packages = dict()
+    for record in load():
+        if record["state"] == "installed":
+            packages.setdefault(record["Package"], record)
+    return packages
+
+
+def holds():
+    """Return the sorted names of the packages on hold."""
+    return sorted({record["Package"] for record in load()
+                   if record["want"] == "hold"})
+
+
+def set_selections(packages, selection, teach=False, noop=False):
+    """Set the dpkg selection of all PACKAGES in one privileged call."""
+    stream = "".join("{} {}\n".format(package, selection)
+                     for package in packages)
+    return perform.run(["/usr/bin/dpkg", "--set-selections"], root=True,
+                       input=stream, teach=teach, noop=noop)
+
+
+def in_state(state):
+    """Return the package:arch names of the packages in dpkg STATE."""
+    return sorted(
+        record["Package"] + (":" + record["Architecture"]
+                             if "Architecture" in record else "")
+        for record in load() if record["state"] == state)
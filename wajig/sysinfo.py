@@ -0,0 +1,255 @@
+# This file is part of wajig.  The copyright file is at debian/copyright.
+
+"""Collect the information reported by the SYSINFO command.
+
+Everything that the kernel or the system files already provide is read
+directly from /proc, /sys, and /etc. Only the video and audio details
+need an external tool (lspci), and that runs alongside the optional
+lookup of the external IP address, which is bounded by a timeout and
+remembered for an hour."""
+
+import os
+import re
+import time
+import struct
+import socket
+import subprocess
+import urllib.request
+import concurrent.futures
+
+import wajig.util as util
+
+EXTERNAL_IP_URL = "https://ipinfo.io/ip"
+EXTERNAL_IP_FILE = os.path.join(util.init_dir, "ExternalIP")
+EXTERNAL_IP_TIMEOUT = 3
+EXTERNAL_IP_MAX_AGE = 3600
+
+REBOOT = "/var/run/reboot-required"
+PKGS = "/var/run/reboot-required.pkgs"
+
+
+def read(path, default=""):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+
+def os_release():
+    """Return the key/value pairs of /etc/os-release."""
+    release = dict()
+    text = read("/etc/os-release") or read("/usr/lib/os-release")
+    for line in text.splitlines():
+        key, sep, value = line.partition("=")
+        if sep:
+            release[key.strip()] = value.strip().strip('"')
+    return release
+
+
+def computer():
+    dmi = "/sys/class/dmi/id/"
+    vendor, product, board, bios, date = (
+        read(dmi + name) for name in
+        ("sys_vendor", "product_name", "board_name",
+         "bios_version", "bios_date"))
+    if not (vendor or product):
+        return None
+    return f"{vendor} {product}/{board}, BIOS {bios} {date}"
+
+
+def processor():
+    model = bogomips = None
+    count = 0
+    for line in read("/proc/cpuinfo").splitlines():
+        key, _, value = line.partition(":")
+        key = key.strip()
+        if key == "processor":
+            count += 1
+        elif key == "model name" and model is None:
+            model = value.strip()
+        elif key.lower() == "bogomips" and bogomips is None:
+            bogomips = value.strip()
+    return dict(model=model, count=count, bogomips=bogomips)
+
+
+def memory():
+    """Return the total memory in kB."""
+    match = re.search(r"^MemTotal:\s+(\d+)", read("/proc/meminfo"), re.M)
+    return int(match.group(1)) if match else None
+
+
+def local_ips():
+    """Return the local IPv4 addresses from the kernel's routing trie."""
+    addresses = list()
+    previous = ""
+    for line in read("/proc/net/fib_trie").splitlines():
+        line = line.strip()
+        if line == "/32 host LOCAL" and previous.startswith("|-- "):
+            address = previous[4:]
+            if address not in addresses:
+                addresses.append(address)
+        previous = line
+    return addresses
+
+
+def external_ip(timeout=EXTERNAL_IP_TIMEOUT):
+    """Return the external IP address, or None if it can not be found."""
+    try:
+        if time.time() - os.path.getmtime(EXTERNAL_IP_FILE) \
+           < EXTERNAL_IP_MAX_AGE:
+            return read(EXTERNAL_IP_FILE) or None
+    except OSError:
+        pass
+    try:
+        with urllib.request.urlopen(EXTERNAL_IP_URL, timeout=timeout) as f:
+            address = f.read(64).decode().strip()
+    except (OSError, ValueError):
+        return None
+    try:
+        with open(EXTERNAL_IP_FILE, "w") as f:
+            f.write(address + "\n")
+    except OSError:
+        pass
+    return address
+
+
+def pci_devices():
+    """Return the video card (with its memory) and audio device."""
+    try:
+        lspci = subprocess.check_output(["lspci"], text=True,
+                                        stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    video = audio = None
+    for line in lspci.splitlines():
+        if video is None and "VGA" in line:
+            slot = line.split()[0]
+            video = line.split(":", 2)[-1].strip()
+            try:
+                detail = subprocess.check_output(
+                    ["lspci", "-v", "-s", slot], text=True,
+                    stderr=subprocess.DEVNULL)
+            except (OSError, subprocess.CalledProcessError):
+                detail = ""
+            match = re.search(r" prefetchable.*=([^\]]*)\]", detail)
+            if match:
+                video += " " + match.group(1)
+        elif audio is None and "Audio device:" in line:
+            audio = line.split("Audio device:", 1)[1].strip()
+    return dict(video=video, audio=audio)
+
+
+def uptime():
+    """Return the seconds since boot."""
+    try:
+        return float(read("/proc/uptime").split()[0])
+    except (IndexError, ValueError):
+        return None
+
+
+def pretty_uptime(seconds):
+    minutes = int(seconds // 60)
+    parts = list()
+    for unit, size in (("week", 7 * 24 * 60), ("day", 24 * 60),
+                       ("hour", 60), ("minute", 1)):
+        value, minutes = divmod(minutes, size)
+        if value:
+            parts.append("{} {}{}".format(value, unit,
+                                          "" if value == 1 else "s"))
+    return "up " + (", ".join(parts) if parts else "0 minutes")
+
+
+def users():
+    """Count the logged in users as recorded in utmp."""
+    record = 384   # sizeof(struct utmp) on Linux
+    user_process = 7
+    count = 0
+    try:
+        with open("/var/run/utmp", "rb") as f:
+            for chunk in iter(lambda: f.read(record), b""):
+                if len(chunk) == record and \
+                   struct.unpack_from("<i", chunk)[0] == user_process:
+                    count += 1
+    except OSError:
+        return None
+    return count
+
+
+def reboot():
+    if not os.path.exists(REBOOT):
+        return dict(required=False, packages=[])
+    packages = sorted(set(read(PKGS).split()))
+    return dict(required=True, packages=packages)
+
+
+def collect(external=True):
+    """Return the system information as a dict."""
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+        pci = pool.submit(pci_devices)
+        exterip = pool.submit(external_ip) if external else None
+
+        release = os_release()
+        seconds = uptime()
+        since = time.strftime("%Y-%m-%d %H:%M:%S",
+                              time.localtime(time.time() - seconds)) \
+            if seconds else None
+        info = dict(
+            hostname=socket.gethostname(),
+            os=dict(name=release.get("NAME"), version=release.get("VERSION"),
+                    kernel=os.uname().release),
+            computer=computer(),
+            processor=processor(),
+            memory=memory(),
+            ip=dict(local=local_ips()),
+            uptime=dict(seconds=seconds, since=since),
+            users=users(),
+            load=list(os.getloadavg()),
+            reboot=reboot(),
+        )
+        info["pci"] = pci.result()
+        info["ip"]["external"] = exterip.result() if exterip else None
+    return info
+
+
+def report(info):
+    """Return the lines of the plain text report of INFO."""
+
+    lines = [f"Hostname:   {info['hostname']}"]
+    system = info["os"]
+    lines.append(f"OS:         {system['name']} {system['version']} "
+                 f"{system['kernel']}")
+    lines.append("Computer:   " + (info["computer"] or
+                                   "</sys/class/dmi/id not accessible>"))
+    cpu = info["processor"]
+    lines.append(f"Processor:  {cpu['model']} x {cpu['count']} = "
+                 f"{cpu['bogomips']} bogomips")
+    pci = info["pci"]
+    if pci:
+        lines.append(f"Video:      {pci['video'] or ''}")
+        lines.append("Audio:      " +
+                     (pci["audio"] or "<lspci found no audio device>"))
+    else:
+        lines.append("Video:      <lspci produces no output>")
+        lines.append("Audio:      <lspci produces no output>")
+    if info["memory"]:
+        gigabytes = round(info["memory"] / (1024 * 1024))
+        lines.append(f"Memory:     {gigabytes}GB RAM")
+    ip = info["ip"]
+    lines.append(f"IP:         {', '.join(ip['local'])} (local) "
+                 f"{ip['external'] or '<unknown>'} (external)")
+    if info["uptime"]["seconds"]:
+        lines.append(f"Uptime:     {pretty_uptime(info['uptime']['seconds'])} "
+                     f"since {info['uptime']['since']}")
+    load = ", ".join("{:.2f}".format(value) for value in info["load"])
+    count = info["users"]
+    users = "" if count is None else \
+        "{} user{}, ".format(count, "" if count == 1 else "s")
+    lines.append(f"Load:       {users}load average: {load}")
+    reboot = info["reboot"]
+    message = "required" if reboot["required"] else "not required"
+    if reboot["packages"]:
+        message += " for " + ", ".join(reboot["packages"]) + " updates"
+    lines.append(f"Reboot:     {message}")
+    return lines
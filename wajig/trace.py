@@ -0,0 +1,101 @@
+# This file is part of wajig.  The copyright file is at debian/copyright.
+
+"""Spans and counters timing the phases of a wajig command.
+
+A span times a phase such as building the APT cache or parsing the
+dpkg status file, and a counter tallies work done such as the packages
+visited. Both are recorded for every run, since there are only a few
+of them and recording them costs next to nothing, so that phases that
+happen before the command line is parsed (the imports) are included.
+
+They are reported when asked for: as a summary on standard error with
+the --trace option or WAJIG_TRACE=1, or as a Chrome trace event file
+(for chrome://tracing or Perfetto) with --trace-file FILE or
+WAJIG_TRACE=FILE."""
+
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+
+ENV = "WAJIG_TRACE"
+
+# The destination of the report: None, "-" for a summary on standard
+# error, or the name of a file.
+
+destination = os.environ.get(ENV) or None
+if destination in ("1", "summary"):
+    destination = "-"
+
+origin = time.perf_counter()
+
+spans = list()
+counters = dict()
+
+
+@contextlib.contextmanager
+def span(name, **details):
+    """Time the phase NAME for the duration of the with statement."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans.append(dict(name=name, start=start - origin,
+                          duration=time.perf_counter() - start,
+                          thread=threading.get_ident(), details=details))
+
+
+def count(name, value=1):
+    """Add VALUE to the counter NAME."""
+    counters[name] = counters.get(name, 0) + value
+
+
+def chrome():
+    """Return the spans and counters as a Chrome trace event document."""
+    pid = os.getpid()
+    events = [dict(name=s["name"], cat="wajig", ph="X", pid=pid,
+                   tid=s["thread"], ts=round(s["start"] * 1e6),
+                   dur=round(s["duration"] * 1e6), args=s["details"])
+              for s in spans]
+    end = round((time.perf_counter() - origin) * 1e6)
+    events.extend(dict(name=name, cat="wajig", ph="C", pid=pid, ts=end,
+                       args={name: value})
+                  for name, value in sorted(counters.items()))
+    return dict(traceEvents=events, displayTimeUnit="ms")
+
+
+def summary():
+    """Lines of the total, count, and longest time of each span."""
+    totals = dict()
+    for s in spans:
+        total, calls, longest = totals.get(s["name"], (0, 0, 0))
+        totals[s["name"]] = (total + s["duration"], calls + 1,
+                             max(longest, s["duration"]))
+    lines = ["{:>9} {:>6} {:>9}  {}".format("Total", "Calls", "Longest",
+                                            "Span")]
+    for name, (total, calls, longest) in sorted(
+            totals.items(), key=lambda item: item[1][0], reverse=True):
+        lines.append("{:>8.3f}s {:>6} {:>8.3f}s  {}".format(
+            total, calls, longest, name))
+    for name, value in sorted(counters.items()):
+        lines.append("{:>9} {:>6} {:>9}  {}".format(value, "", "", name))
+    lines.append("{:>8.3f}s {:>6} {:>9}  wajig".format(
+        time.perf_counter() - origin, "", ""))
+    return lines
+
+
+def report():
+    """Report the spans and counters to the destination, if any."""
+    if not destination:
+        return
+    if destination == "-":
+        print("\n".join(summary()), file=sys.stderr)
+        return
+    try:
+        with open(destination, "w") as f:
+            json.dump(chrome(), f)
+    except OSError as error:
+        print("wajig: could not write trace: {}".format(error),
+              file=sys.stderr)
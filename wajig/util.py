@@ -14,6 +14,7 @@ import apt
 import apt_pkg
 
 import wajig.perform as perform
+import wajig.trace as trace
 
 # 20211026 Debian does not have the quicker rapidfuzz, so fall back to
 # thefuzz. Both have the same interface.
@@ -94,6 +95,86 @@ if not os.path.exists(new_file):
 available_file = init_dir + "/Available"
 previous_file = init_dir + "/Available.prv"
 
+# The packages new, removed, and with a new version at each update,
+# one JSON record per line, appended to and never rewritten.
+
+new_history_file = init_dir + "/NewHistory"
+
+
+def read_index(path):
+    """Return the JSON index kept in the wajig file PATH.
+
+    An index is only a cache, so an empty dict is returned if the file
+    is missing or unreadable and the caller rebuilds it."""
+
+    import json
+
+    try:
+        with open(path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return dict()
+    return index if isinstance(index, dict) else dict()
+
+
+def write_index(path, index):
+    """Save INDEX as JSON in the wajig file PATH.
+
+    The file is written under a name unique to this host and process
+    and then renamed, so a wajig running at the same time (on this or
+    another host sharing the home directory) never reads it half
+    written. A failure to save is ignored."""
+
+    import json
+
+    partial = "{}.{}.{}".format(path, socket.gethostname(), os.getpid())
+    try:
+        with open(partial, "w") as f:
+            json.dump(index, f)
+        os.replace(partial, path)
+    except OSError:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+def file_digest(path, algorithm="sha256"):
+    """The hex digest of the contents of PATH, read in 1MiB chunks."""
+    import hashlib
+
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# The compressions APT may keep its list files in.
+
+LIST_COMPRESSION = ("gz", "xz", "bz2", "lzma", "lz4", "zst")
+
+
+def lists_dir():
+    return apt_pkg.config.find_dir("Dir::State::Lists")
+
+
+def list_files(kind):
+    """Return the KIND (Packages or Sources) indexes in the lists directory.
+
+    The indexes may be compressed; apt_pkg.TagFile opens those itself
+    given just the path."""
+
+    directory = lists_dir()
+    if not os.path.isdir(directory):
+        return []
+    paths = list()
+    for entry in os.scandir(directory):
+        name, _, extension = entry.name.rpartition(".")
+        if extension not in LIST_COMPRESSION:
+            name = entry.name
+        if name.endswith("_" + kind) and entry.is_file():
+            paths.append(entry.path)
+    return sorted(paths)
+
 # Set the temporary directory to the init_dir.
 # Large files are not generally written there so should be okay.
 tempfile.tempdir = init_dir
@@ -188,62 +269,134 @@ def get_misspelled_pkg(model):
 # -----------------------------------------------------------------------
 
 
-def newly_available(verbose=False):
-    """display brand-new packages.. technically new package names"""
-    with open(new_file) as f:
-        packages = f.readlines()
-        if verbose:
-            for package in packages:
-                perform.execute('aptitude show ' + package)
-        else:
-            do_describe([package.strip() for package in packages], die=False)
+def newly_available(verbose=False, since=None):
+    """display brand-new packages.. technically new package names
+
+    With SINCE (YYYY-MM-DD [HH:MM:SS]) display the packages that have
+    become available at any update since then and are still available,
+    rather than only those of the last update."""
+
+    if since:
+        available = read_available(available_file)
+        packages = set()
+        for entry in new_history():
+            if entry["time"] >= since:
+                packages.update(entry["new"])
+        packages = sorted(package for package in packages
+                          if package in available)
+    else:
+        with open(new_file) as f:
+            packages = f.read().split()
+    if packages:
+        do_describe(packages, verbose=verbose, die=False)
+
+
+def parse_date(text):
+    """Return the date (and time) TEXT as YYYY-MM-DD HH:MM:SS.
+
+    Raises ValueError if TEXT is not an ISO format date."""
+
+    return str(datetime.fromisoformat(text))
+
+
+def read_available(path):
+    """Return a dict mapping package names to versions from PATH.
+
+    PATH is one of the Available files, a line of name and version for
+    each package."""
+
+    packages = dict()
+    try:
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 2:
+                    packages[fields[0]] = fields[1]
+    except FileNotFoundError:
+        pass
+    return packages
+
+
+def write_available(path, packages):
+    """Write PACKAGES, mapping names to versions, as an Available file."""
+    with open(path, "w") as f:
+        f.writelines("{} {}\n".format(name, packages[name])
+                     for name in sorted(packages))
+
+
+def compare_available(previous, available):
+    """Return the packages new, removed, and bumped between two updates.
+
+    PREVIOUS and AVAILABLE map package names to versions. Bumped
+    packages are listed as [name, previous version, version]."""
+
+    new = sorted(available.keys() - previous.keys())
+    removed = sorted(previous.keys() - available.keys())
+    bumped = sorted([name, previous[name], version]
+                    for name, version in available.items()
+                    if name in previous and previous[name] != version)
+    return new, removed, bumped
+
+
+def record_new(new, removed, bumped):
+    """Append the changes of an update to the new packages history."""
+    import json
+
+    entry = dict(time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                 new=new, removed=removed, bumped=bumped)
+    with open(new_history_file, "a") as f:
+        f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+
+def new_history():
+    """Yield the recorded changes of each update, oldest first."""
+    import json
+
+    try:
+        with open(new_history_file) as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        return
 
 
 def update_available(noreport=False):
     """Generate current list of available packages, backing up the old list
-    """
 
-    if not os.path.exists(available_file):
-        f = open(available_file, "w")
-        f.close()
+    The packages that are new, removed, or have a new version since
+    the previous list, if there are any, are appended to the new
+    packages history."""
 
-    temporary_file = tempfile.mkstemp()[1]
+    import wajig.lists as lists
 
-    os.rename(available_file, temporary_file)
-    # sort --unique so packages with more that one architecture are included
-    # only once. This makes the count shown by "update" consistent with the
+    # Packages with more than one architecture are included only
+    # once. This makes the count shown by "update" consistent with the
     # output of "toupgrade", though not necessarily with the list shown
     # by "upgrade" (really "apt-get --show-upgraded upgrade"), which might
-    # show amd64 and i386 versions.
-    command = ("apt-cache dumpavail "
-               "| egrep '^(Package|Version):' "
-               "| tr '\n' ' '"
-               "| perl -p -e 's|Package: |\n|g; s|Version: ||g'"
-               "| sort -u -k 1b,1 | tail -n +2 | sed 's| $||' > ") \
-                + available_file
-    # Use langC in the following since it uses a grep.
-    perform.execute(command, langC=True)  # root is not required.
-    os.rename(temporary_file, previous_file)
-
-    available_packages = open(available_file).readlines()
-    previous_packages = open(previous_file).readlines()
-    diff = len(available_packages) - len(previous_packages)
-
-    temporary_file = tempfile.mkstemp()[1]
-    # 090425 Use langC=True to work with change from coreutils 6.10 to 7.2
-    command = "join -v 1 -t' '  {0} {1} | cut -d' ' -f 1 | tee {2} | wc -l"
-    command = command.format(available_file, previous_file, temporary_file)
-    newest = perform.execute(command, pipe=True, langC=True)
-    newest = newest.readlines()[0].strip()
-
-    # 20241205 gjw If there are new packages available then note them
-    # in the New file. If not, remove the old New file.
-
-    if newest != "0":
-        os.rename(temporary_file, new_file)
-    else:
-        os.remove(new_file)
-        os.remove(temporary_file)
+    # show amd64 and i386 versions. Only the Packages lists that changed
+    # since the last update are parsed again.
+
+    previous = read_available(available_file)
+    available = lists.available()
+    write_available(previous_file, previous)
+    write_available(available_file, available)
+
+    diff = len(available) - len(previous)
+    new, removed, bumped = compare_available(previous, available)
+
+    # Without a previous list (the first update) every package would
+    # be new, which is not worth noting, and an update that changed
+    # nothing is not noted either.
+
+    if previous:
+        if new or removed or bumped:
+            record_new(new, removed, bumped)
+        with open(new_file, "w") as f:
+            f.writelines(name + "\n" for name in new)
+    newest = str(len(new))
 
     if not noreport:
         if diff < 0:
@@ -263,7 +416,8 @@ def update_available(noreport=False):
 def gen_installed_command_str():
     """Generate command to list installed packages and their status."""
     # Use sort --unique. See comment in update_available().
-    command = ("cat /var/lib/dpkg/status | "
+    status_file = apt_pkg.config.find_file("Dir::State::status")
+    command = ("cat " + status_file + " | "
                "egrep '^(Package|Status|Version):' | "
                "awk '/^Package: / {pkg=$2} "
                "     /^Status: / {s1=$2;s2=$3;s3=$4}"
@@ -273,21 +427,23 @@ def gen_installed_command_str():
 
 
 def count_upgrades():
-    """Return as a string the number of new upgrades since last update."""
-    ifile = tempfile.mkstemp()[1]
-    # Use langC in the following since it uses a grep.
-    perform.execute(gen_installed_command_str() + " > " + ifile, langC=True)
-    command = ("join %s %s |"
-               "awk '$2 != $3 {print}' | sort -k 1b,1 | join - %s |"
-               "awk '$4 != $3 {print}' | wc -l | awk '{print $1}' ") % \
-               (previous_file, available_file, ifile)
-    # 090425 Use langC=True to work with change from coreutils 6.10 to 7.2
-    count = perform.execute(
-        command, pipe=True, langC=True
-    ).read().split()[0]
-    if os.path.exists(ifile):
-        os.remove(ifile)
-    return count
+    """Return as a string the number of new upgrades since last update.
+
+    These are installed packages with a version available at the last
+    update that differs from both the version available before it and
+    the version installed."""
+
+    import wajig.status as status
+
+    previous = read_available(previous_file)
+    available = read_available(available_file)
+    count = 0
+    for name, record in status.installed().items():
+        version = available.get(name)
+        if version and name in previous and previous[name] != version \
+           and record.get("Version") != version:
+            count += 1
+    return str(count)
 
 
 def reset_files():
@@ -300,8 +456,9 @@ def reset_files():
 
 def ensure_initialised():
     """Create the init_dir and files if they don't exist."""
-    if not os.path.exists(available_file):
-        reset_files()
+    with trace.span("ensure_initialised"):
+        if not os.path.exists(available_file):
+            reset_files()
 
 
 def backup_before_upgrade(packages):
@@ -309,17 +466,71 @@ def backup_before_upgrade(packages):
 
      This optional functionality helps recovery in case of trouble caused
      by the newly-installed packages. The packages are by default stored
-     in a directory named like  ~/.wajig/hostname/backups/2010-09-21_09h21."""
+     in a directory named like  ~/.wajig/hostname/backups/2010-09-21_09h21.
+
+     A package already saved by an earlier backup is hardlinked from
+     there, one still in the download cache is taken from there, and
+     only the remainder are rebuilt with dpkg-repack, several at once,
+     with the output of each shown in turn."""
+
+    import concurrent.futures
+    import wajig.status as status
+    import wajig.archives as archives
 
     date = time.strftime("%Y-%m-%d_%Hh%M", time.localtime())
-    target = os.path.join(init_dir, "backups", date)
+    backups = os.path.join(init_dir, "backups")
+    target = os.path.join(backups, date)
     if not os.path.exists(target):
         os.makedirs(target)
-    os.chdir(target)
     print("The packages will saved in", target)
+
+    # Earlier backups, most recent first, by file name.
+    previous = dict()
+    for directory in sorted(os.listdir(backups), reverse=True):
+        directory = os.path.join(backups, directory)
+        if directory != target and os.path.isdir(directory):
+            for filename in os.listdir(directory):
+                previous.setdefault(filename, os.path.join(directory, filename))
+
+    # Keyed by name and architecture as several architectures of a
+    # package may be installed, each possibly at its own version.
+    installed = {(record["Package"], record.get("Architecture", "all")):
+                 record for record in status.load()
+                 if record["state"] == "installed"}
+    native = apt_pkg.config.find("APT::Architecture")
+    repack = list()
     for package in packages:
-        command = "fakeroot -u dpkg-repack " + package
-        perform.execute(command)
+        name, _, arch = package.partition(":")
+        arches = [arch] if arch else [native, "all"]
+        found = [(arch, installed[name, arch]) for arch in arches
+                 if (name, arch) in installed]
+        if not found:
+            repack.append(package)
+            continue
+        arch, record = found[0]
+        version = record["Version"]
+        # dpkg-deb names its packages without the epoch.
+        filename = "{}_{}_{}.deb".format(name, version.split(":")[-1], arch)
+        source = previous.get(filename) or \
+            archives.find(name, version, arch)
+        if not source:
+            repack.append(package)
+            continue
+        try:
+            os.link(source, os.path.join(target, filename))
+        except OSError:
+            import shutil
+            shutil.copy2(source, os.path.join(target, filename))
+
+    command = ["fakeroot", "-u", "dpkg-repack"]
+    with concurrent.futures.ThreadPoolExecutor(os.cpu_count()) as pool:
+        results = pool.map(lambda package: perform.capture(
+            command + [package], cwd=target, merge=True), repack)
+        for package, (result, output) in zip(repack, results):
+            print(output, end="")
+            if result:
+                print("dpkg-repack {}: failed (exit status {})".format(
+                    package, result))
 
 
 def requires_package(package, path=None):
@@ -333,6 +544,137 @@ def requires_package(package, path=None):
     sys.exit(1)
 
 
+# ------------------------------------------------------------------------
+# APT CACHES
+#
+#       The APT caches are shared by everything in the process, each
+#       opened at most once and only when first needed. Read-only
+#       queries use the low-level apt_pkg cache and pin policy, which
+#       need no depcache and report no progress. The full apt.Cache,
+#       which takes a second or more and several hundred MB to open on
+#       large archive sets, is built only for resolving changes (an
+#       upgrade plan) or where apt.Package objects are needed.
+#
+# ------------------------------------------------------------------------
+
+caches = dict()
+
+
+def apt_cache():
+    """Return the full apt.Cache, opening it on first use."""
+    if "apt" not in caches:
+        with trace.span("apt.Cache"):
+            caches["apt"] = apt.Cache()
+    return caches["apt"]
+
+
+def pkg_cache():
+    """Return the low-level apt_pkg.Cache, opening it on first use.
+
+    The full cache is built on an apt_pkg.Cache, so that one is used
+    if the full cache is already open."""
+
+    if "pkg" not in caches:
+        if "apt" in caches:
+            caches["pkg"] = caches["apt"]._cache
+        else:
+            with trace.span("apt_pkg.Cache"):
+                caches["pkg"] = apt_pkg.Cache(None)
+    return caches["pkg"]
+
+
+def pkg_policy():
+    """Return the pin policy of the low-level cache, as APT reads it."""
+    if "policy" not in caches:
+        policy = apt_pkg.Policy(pkg_cache())
+        config = apt_pkg.config
+        policy.read_pindir(config.find_dir("Dir::Etc::PreferencesParts"))
+        policy.read_pinfile(config.find_file("Dir::Etc::Preferences"))
+        policy.init_defaults()
+        caches["policy"] = policy
+    return caches["policy"]
+
+
+def pkg_lookup(name):
+    """Return the package called NAME (which may be name:arch) or None.
+
+    Purely virtual packages, having no versions, are returned too."""
+
+    cache = pkg_cache()
+    name, _, arch = name.partition(":")
+    try:
+        return cache[name, arch] if arch else cache[name]
+    except KeyError:
+        return None
+
+
+def candidate_version(package):
+    """The version of PACKAGE that APT would install, or None."""
+    return pkg_policy().get_candidate_ver(package)
+
+
+def section(package):
+    """The section of the version of PACKAGE that APT would install."""
+    version = candidate_version(package) or package.current_ver or \
+        package.version_list[0]
+    return version.section
+
+
+def find_package(name, ignore_virtual_packages=False):
+    """Return the package NAME from the low-level cache or exit.
+
+    A virtual package is replaced by the first package providing it."""
+
+    package = pkg_lookup(name)
+    if package is not None and package.has_provides and \
+       not package.has_versions and not ignore_virtual_packages:
+        return package.provides_list[0][2].parent_pkg
+    if package is None or not package.has_versions:
+        print("The cache has no package named '{}'".format(name))
+        sys.exit(1)
+    return package
+
+
+def dependencies(package, dependency_type="Depends"):
+    """Produce the names of the candidate's dependencies of a type."""
+    version = candidate_version(package)
+    if not version:
+        return
+    for or_group in version.depends_list.get(dependency_type, []):
+        for dependency in or_group:
+            yield dependency.target_pkg.name
+
+
+def description(version):
+    """Return the summary and the formatted description of VERSION.
+
+    The description is formatted as by apt.package.Version."""
+
+    if "records" not in caches:
+        caches["records"] = apt_pkg.PackageRecords(pkg_cache())
+    records = caches["records"]
+    found = version.translated_description
+    if not found.file_list:
+        return "", ""
+    records.lookup(found.file_list[0])
+    lines = iter(records.long_desc.split("\n"))
+    next(lines, None)  # The summary again.
+    text = ""
+    for line in lines:
+        if line.strip() == ".":
+            if not text.endswith("\n"):
+                text += "\n\n"
+            continue
+        if line.startswith("  "):
+            line = line[2:] + "\n"
+            if not text.endswith("\n"):
+                line = "\n" + line
+        elif line.startswith(" ") and (text.endswith("\n") or not text):
+            line = line[1:]
+        text += line
+    return records.short_desc, text
+
+
 def package_exists(cache, package, ignore_virtual_packages=False):
     try:
         if cache.is_virtual_package(package) and not ignore_virtual_packages:
@@ -343,36 +685,75 @@ def package_exists(cache, package, ignore_virtual_packages=False):
         sys.exit(1)
 
 
-def upgradable(distupgrade=False, get_names_only=True):
-    "Checks if the system is upgradable."
-    cache = apt.Cache()
-    cache.upgrade(distupgrade)
-    if get_names_only:
-        packages = [package.name for package in cache.get_changes()]
-    else:
-        packages = [package for package in cache.get_changes()]
-    return packages
+upgrades_file = os.path.join(init_dir, "Upgradable")
 
 
-def local_changelog(package, tmp):
-    """Retrieve Debian changelog from local installation."""
-    changelog = "/usr/share/doc/" + package + "/changelog.Debian.gz"
-    changelog_native = "/usr/share/doc/" + package + "/changelog.gz"
-    if os.path.exists(changelog):
-        return "zcat {0} >> {1}".format(changelog, tmp)
-    elif os.path.exists(changelog_native):
-        return "zcat {0} >> {1}".format(changelog_native, tmp)
-    else:
-        print("Package", package, "is likely broken (changelog not found)!")
+def upgrade_plan_key():
+    """Identify the APT state that an upgrade plan is computed from.
 
+    This is the modification time of the package lists, the dpkg
+    status, the auto-installed flags, and the pinning preferences."""
+
+    config = apt_pkg.config
+    paths = [config.find_file("Dir::State::status"),
+             config.find_file("Dir::State::extended_states"),
+             config.find_file("Dir::Etc::Preferences")]
+    for directory in (config.find_dir("Dir::State::Lists"),
+                      config.find_dir("Dir::Etc::PreferencesParts")):
+        paths.append(directory)
+        if os.path.isdir(directory):
+            paths.extend(sorted(entry.path for entry in os.scandir(directory)
+                                if entry.is_file()))
+    key = list()
+    for path in paths:
+        try:
+            key.append([path, os.stat(path).st_mtime_ns])
+        except OSError:
+            pass
+    return key
+
+
+def upgrade_plan(distupgrade=False):
+    """Return the packages an (dist)upgrade would change.
+
+    Each is a dict of the name, the candidate and installed versions,
+    and the download and installed sizes of the candidate. The plan is
+    kept in the wajig directory and only recomputed (a full depcache
+    resolution) once the APT state it was computed from has changed."""
+
+    kind = "distupgrade" if distupgrade else "upgrade"
+    key = upgrade_plan_key()
+    plans = read_index(upgrades_file)
+    if plans.get("key") != key:
+        plans = dict(key=key)
+    if kind in plans:
+        return plans[kind]
+
+    cache = apt_cache()
+    with trace.span("upgrade resolution", kind=kind):
+        cache.upgrade(distupgrade)
+    plan = list()
+    for package in cache.get_changes():
+        candidate = package.candidate if not package.marked_delete else None
+        plan.append(dict(
+            name=package.name,
+            candidate=candidate.version if candidate else None,
+            installed=package.installed.version if package.installed else None,
+            size=candidate.size if candidate else 0,
+            installed_size=candidate.installed_size if candidate else 0,
+        ))
+    cache.clear()  # The cache is shared, so leave it unmarked.
+    plans[kind] = plan
+    write_index(upgrades_file, plans)
+    return plan
 
-def extract_dependencies(package, dependency_type="Depends"):
-    """Produce all Dependencies of a particular type"""
-    if not package.candidate:
-        return
-    for dependency_list in package.candidate.get_dependencies(dependency_type):
-        for dependency in dependency_list.or_dependencies:
-            yield dependency.name
+
+def upgradable(distupgrade=False, get_names_only=True):
+    "Checks if the system is upgradable."
+    packages = upgrade_plan(distupgrade)
+    if get_names_only:
+        packages = [package["name"] for package in packages]
+    return packages
 
 
 def do_describe(packages, verbose=False, die=True):
@@ -397,31 +778,30 @@ def do_describe(packages, verbose=False, die=True):
         print("No packages found from those known to be available/installed.")
     else:
         packageversions = list()
-        cache = apt.cache.Cache()
-        for package in packages:
-            try:
-                package = cache[package]
-            except KeyError as e:
+        for name in packages:
+            package = pkg_lookup(name)
+            if package is None or not package.has_versions:
                 import subprocess
                 command = 'dpkg --print-foreign-architectures'.split()
                 output = subprocess.check_output(command)
                 for arch in output.decode().split():
-                    try:
-                        package = cache["{}:{}".format(package, arch)]
-                        # to avoid noise, only consider the 1st match
+                    package = pkg_lookup("{}:{}".format(name, arch))
+                    # to avoid noise, only consider the 1st match
+                    if package is not None and package.has_versions:
                         break
-                    except KeyError:
-                        pass
-                if not isinstance(package, apt.package.Package) and die:
-                    print(str(e).strip('"'))
-                    return 1
-            packageversion = package.installed
+                if package is None or not package.has_versions:
+                    if die:
+                        print("The cache has no package named '{}'"
+                              .format(name))
+                        return 1
+                    continue
+            packageversion = package.current_ver
             if not packageversion:  # if package is not installed...
-                packageversion = package.candidate
-            packageversions.append((
-                package.shortname, packageversion.summary,
-                packageversion.description
-            ))
+                packageversion = candidate_version(package)
+            if not packageversion:
+                continue
+            packageversions.append((package.name,)
+                                   + description(packageversion))
         packageversions = set(packageversions)
         if verbose:
             for packageversion in packageversions:
@@ -440,37 +820,14 @@ def show_package_versions():
     if packages:
         print(f'{"Package":<{CW}} {"Available":<{CW}} Installed')
         print("="*CW + "-" + "="*CW + "-" + "="*CW)
-        for package in sorted(packages):
-            message = f"{package.name:<{CW}} "
-            message += f"{package.candidate.version:<{CW}} "
-            message += f"{package.installed.version}"
+        for package in sorted(packages, key=lambda p: p["name"]):
+            message = f"{package['name']:<{CW}} "
+            message += f"{package['candidate'] or 'N/A':<{CW}} "
+            message += f"{package['installed'] or 'N/A'}"
             print(message)
     return packages
 
 
-def display_sys_docs(package, filenames):
-    """This services README and NEWS commands"""
-    docpath = os.path.join("/usr/share/doc", package)
-    if not os.path.exists(docpath):
-        if package_exists(apt.Cache(), package):
-            print("'{}' is not installed".format(package))
-        return
-    found = False
-    for filename in filenames:
-        path = os.path.join(docpath, filename)
-        cat = "cat"
-        if not os.path.exists(path):
-            path += ".gz"
-            cat = "zcat"
-        if os.path.exists(path):
-            found = True
-            print("{0:=^72}".format(" {0} ".format(filename)))
-            sys.stdout.flush()
-            perform.execute(cat + " " + path)
-    if not found:
-        print("File not found")
-
-
 def do_status(packages, snapshot=False):
     """List status of the packages identified"""
 
@@ -527,25 +884,20 @@ def do_status(packages, snapshot=False):
         os.remove(ifile)
 
 
-def do_listnames(pattern=False, pipe=False, teach=False, noop=False):
+def do_listnames(pattern=False, teach=False, noop=False):
+    """Yield the sorted names of the known packages matching PATTERN.
+
+    PATTERN is an extended regular expression as for grep -E. The
+    names are yielded, each ending with a newline, as they are read."""
 
     # If user can't access /etc/apt/sources.list then must do this with
     # sudo or else most packages will not be found.
     needsudo = not os.access("/etc/apt/sources.list", os.R_OK)
+    pipeline = [["apt-cache", "pkgnames"]]
     if pattern:
-        command = "apt-cache pkgnames | grep -E -- " + pattern \
-                + " | sort -k 1b,1"
-    else:
-        command = "apt-cache pkgnames | sort -k 1b,1"
-    # Start fix for Bug #292581 - pre-run command to check for no output
-    results = perform.execute(command, root=needsudo, pipe=True,
-                              teach=teach, noop=noop)
-    if results:
-        lines = results.readlines()
-        if lines:
-            return perform.execute(command, root=needsudo, pipe=pipe)
-    else:
-        sys.exit(1)
+        pipeline.append(["grep", "-E", "--", pattern])
+    pipeline.append(["sort", "-k", "1b,1"])
+    return perform.stream(*pipeline, root=needsudo, teach=teach, noop=noop)
 
 
 def do_update(simulate=False):
@@ -555,14 +907,13 @@ def do_update(simulate=False):
             print("There are {} new upgrades".format(count_upgrades()))
 
 
-def get_deps_recursively(cache, package, packages):
+def get_deps_recursively(package, packages):
     if not package in packages:
         packages.append(package)
-    for package_name in \
-        extract_dependencies(package_exists(cache, package)):
+    for package_name in dependencies(find_package(package)):
         if package_name not in packages:
             packages.append(package_name)
-            get_deps_recursively(cache, package_name, packages)
+            get_deps_recursively(package_name, packages)
     return packages
 
 
@@ -583,7 +934,8 @@ def consolidate_package_names(args):
 
 
 def sizes(packages=None, size=0):
-    status = apt_pkg.TagFile(open("/var/lib/dpkg/status", "r"))
+    status = apt_pkg.TagFile(
+        open(apt_pkg.config.find_file("Dir::State::status"), "r"))
     size_list = dict()
     status_list = dict()
 
@@ -613,6 +965,41 @@ def sizes(packages=None, size=0):
         print("No packages of >10MB size found")
 
 
+def batches(words, command=""):
+    """Split WORDS into lists that fit on a command line after COMMAND.
+
+    perform.execute() passes the whole command line to the shell as a
+    single argument, so each batch is bounded by the kernel's limit on
+    one argument (MAX_ARG_STRLEN, 128KiB) as well as by ARG_MAX less
+    the space taken by the environment, with room left for sudo."""
+
+    limit = min(os.sysconf("SC_ARG_MAX") -
+                sum(len(k) + len(v) + 2 for k, v in os.environ.items()),
+                128 * 1024)
+    limit -= len(command) + 1024
+    batch = list()
+    length = 0
+    for word in words:
+        if batch and length + len(word) + 1 > limit:
+            yield batch
+            batch = list()
+            length = 0
+        batch.append(word)
+        length += len(word) + 1
+    if batch:
+        yield batch
+
+
+def human_size(size):
+    """Format a size in bytes in the style of ls -sh."""
+    for unit in "BKMGT":
+        if size < 1024 or unit == "T":
+            break
+        size /= 1024
+    return "{:.0f}{}".format(size, unit) if unit == "B" or size >= 10 \
+        else "{:.1f}{}".format(size, unit)
+
+
 log_file = os.path.join(init_dir, 'Log')
 
 def start_log(old_log):
@@ -0,0 +1,147 @@
+# This file is part of wajig.  The copyright file is at debian/copyright.
+
+"""Version, origin, and pin report for any number of packages.
+
+The report is built from a single load of the APT package cache and
+pin policy, so asking about every installed package costs the same one
+cache load as asking about a single package, rather than a separate
+apt-show-versions or apt-cache process for each."""
+
+import json
+
+import wajig.util as util
+
+
+def open_cache():
+    """Return the APT package cache and its pin policy.
+
+    These are the low-level cache and policy shared by the process."""
+    return util.pkg_cache(), util.pkg_policy()
+
+
+def origin(pkgfile, policy):
+    if pkgfile.not_source:
+        return dict(priority=policy.get_priority(pkgfile), archive="now",
+                    codename=None, component=None, origin=None, site=None,
+                    architecture=None, filename=pkgfile.filename)
+    return dict(priority=policy.get_priority(pkgfile),
+                archive=pkgfile.archive, codename=pkgfile.codename,
+                component=pkgfile.component, origin=pkgfile.origin,
+                site=pkgfile.site, architecture=pkgfile.architecture,
+                filename=pkgfile.filename)
+
+
+def record(package, policy):
+    """Return the versions report of one package as a dict."""
+    installed = package.current_ver
+    candidate = policy.get_candidate_ver(package)
+    versions = list()
+    for version in package.version_list:
+        origins = [origin(pkgfile, policy)
+                   for pkgfile, _ in version.file_list]
+        try:
+            priority = policy.get_priority(version)
+        except TypeError:
+            priority = max((o["priority"] for o in origins), default=0)
+        versions.append(dict(version=version.ver_str, arch=version.arch,
+                             priority=priority, origins=origins))
+    return dict(
+        name=package.get_fullname(True),
+        installed=installed.ver_str if installed else None,
+        candidate=candidate.ver_str if candidate else None,
+        versions=versions,
+    )
+
+
+def report(names=None):
+    """Return the versions report of NAMES, or all installed packages.
+
+    Names that are not known to APT are reported with no versions."""
+
+    cache, policy = open_cache()
+    if not names:
+        packages = [package for package in cache.packages
+                    if package.current_ver]
+        return sorted((record(package, policy) for package in packages),
+                      key=lambda r: r["name"])
+    records = list()
+    for name in names:
+        package = util.pkg_lookup(name)
+        if package is None:
+            records.append(dict(name=name, installed=None, candidate=None,
+                                versions=[]))
+        else:
+            records.append(record(package, policy))
+    return records
+
+
+def suite(record, version):
+    """The first archive (suite) providing VERSION of RECORD."""
+    for entry in record["versions"]:
+        if entry["version"] == version:
+            for o in entry["origins"]:
+                if o["archive"] != "now":
+                    return o["archive"]
+    return ""
+
+
+def table_lines(records, width):
+    lines = [f'{"Package":<{width}} {"Installed":<{width}} '
+             f'{"Candidate":<{width}} Suite',
+             "=" * width + "-" + "=" * width + "-" + "=" * width + "-" +
+             "=" * 12]
+    for r in records:
+        lines.append(f'{r["name"]:<{width}} {r["installed"] or "N/A":<{width}} '
+                     f'{r["candidate"] or "N/A":<{width}} '
+                     f'{suite(r, r["candidate"]) or suite(r, r["installed"])}')
+    return lines
+
+
+def describe_origin(o):
+    if o["archive"] == "now":
+        return o["filename"]
+    area = o["archive"] + ("/" + o["component"] if o["component"] else "")
+    return " ".join(filter(None, (o["site"], area, o["architecture"],
+                                  "Packages")))
+
+
+def madison_lines(records):
+    """Lines in the style of apt-cache madison."""
+    lines = list()
+    for r in records:
+        for entry in r["versions"]:
+            for o in entry["origins"]:
+                if o["archive"] != "now":
+                    lines.append("{:>10} | {:>10} | {}".format(
+                        r["name"], entry["version"], describe_origin(o)))
+    return lines
+
+
+def policy_lines(records):
+    """Lines in the style of apt-cache policy."""
+    lines = list()
+    for r in records:
+        lines.append(r["name"] + ":")
+        lines.append("  Installed: " + (r["installed"] or "(none)"))
+        lines.append("  Candidate: " + (r["candidate"] or "(none)"))
+        lines.append("  Version table:")
+        for entry in r["versions"]:
+            mark = " ***" if entry["version"] == r["installed"] else "    "
+            lines.append("{} {} {}".format(mark, entry["version"],
+                                           entry["priority"]))
+            for o in entry["origins"]:
+                lines.append("        {:>3} {}".format(o["priority"],
+                                                      describe_origin(o)))
+    return lines
+
+
+def show(args, format):
+    """Print the report of the packages of a command line using FORMAT.
+
+    With --json the records are printed instead."""
+    records = report(list(dict.fromkeys(args.packages)))
+    if args.json:
+        print(json.dumps(records, indent=2))
+        return
+    for line in format(records):
+        print(line)